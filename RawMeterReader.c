@@ -11,36 +11,144 @@
 
     gcc RawMeterReader.c -o RawMeterReader.exe -lusb-1.0
 
-  You need libusb-1.0-dev installed. 
+  You need libusb-1.0-dev installed.
 
   to run:
     PATH=$PATH:. java -jar DataLogger.jar
 
+  Each reading is printed as a line of 15 hex bytes. Lines starting
+  with '#' are status:
+
+    # status connected
+    # status disconnected
+    # heartbeat N       printed every second, N is the number of ms
+                        since the last reading, or since the meter was
+                        connected if it has not sent one (-1 if it has
+                        never been connected)
+
+  so a reader can tell a meter that has gone away from one that has
+  stopped sending. Readings use asynchronous interrupt transfers, and
+  the meter is re-opened as soon as libusb reports it is back. Where
+  hotplug is not supported it is polled for every RECONNECT_MS for
+  the first FAST_RECONNECT_MS after it goes away, then only every
+  HEARTBEAT_MS, so an unplugged meter doesn't keep the bus busy.
+
+  "make test-reader" builds this against the stub libusb in test/
+  and checks the status lines and reconnect time.
  */
 #include <libusb-1.0/libusb.h>
 #include <stdio.h>
 #include <string.h>
 #include <unistd.h>
 #include <stdlib.h>
+#include <time.h>
+
+#define VENDOR_ID	0x1244
+#define PRODUCT_ID	0xd237
+#define RECONNECT_MS	20
+#define FAST_RECONNECT_MS	1000
+#define HEARTBEAT_MS	1000
+
+static libusb_device_handle *h;
+static struct libusb_transfer *transfer;
+static unsigned char data[14];
+static int transfer_active;
+static int have_hotplug;
+static int device_arrived;
+static int device_failed;
+static long long last_data_ms = -1;
 
-void read_device(void)
+static long long now_ms(void)
 {
-	libusb_context *ctx;
-	unsigned short vendor_id  = 0x1244;
-	unsigned short product_id = 0xd237;
-	libusb_device_handle *h;
-	int ret, nread;
-	unsigned char data[14];
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (long long)ts.tv_sec * 1000 + ts.tv_nsec / 1000000;
+}
+
+static void print_line(const char *fmt, const char *arg)
+{
+	printf(fmt, arg);
+	if (fflush(stdout) != 0) {
+		exit(1);
+	}
+}
+
+static void LIBUSB_CALL read_callback(struct libusb_transfer *t)
+{
+	int i;
+
+	transfer_active = 0;
+	if (t->status != LIBUSB_TRANSFER_COMPLETED || t->actual_length != 14) {
+		fprintf(stderr, "interrupt transfer status=%d nread=%d\n",
+			t->status, t->actual_length);
+		device_failed = 1;
+		return;
+	}
+
+	last_data_ms = now_ms();
+	printf("00 ");
+	for (i=0;i<14;i++) {
+		printf("%02X ", data[i]);
+	}
+	if (printf("\n") < 0 ||
+	    fflush(stdout) != 0) {
+		exit(1);
+	}
+
+	memset(data, 0, sizeof(data));
+	if (libusb_submit_transfer(t) != 0) {
+		device_failed = 1;
+		return;
+	}
+	transfer_active = 1;
+}
+
+static int LIBUSB_CALL hotplug_callback(libusb_context *ctx, libusb_device *dev,
+				       libusb_hotplug_event event, void *private)
+{
+	if (event == LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED) {
+		device_arrived = 1;
+	} else if (event == LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT) {
+		device_failed = 1;
+	}
+	return 0;
+}
+
+static void close_device(libusb_context *ctx)
+{
+	if (transfer != NULL) {
+		/* a transfer still in flight has to be
+		   cancelled and reaped before it is freed */
+		if (transfer_active && libusb_cancel_transfer(transfer) == 0) {
+			int tries;
+			for (tries=0; transfer_active && tries<10; tries++) {
+				struct timeval tv = { 0, 10000 };
+				libusb_handle_events_timeout(ctx, &tv);
+			}
+		}
+		if (!transfer_active) {
+			libusb_free_transfer(transfer);
+		}
+		transfer = NULL;
+		transfer_active = 0;
+	}
+	if (h != NULL) {
+		libusb_release_interface(h, 0);
+		libusb_close(h);
+		h = NULL;
+		print_line("# status %s\n", "disconnected");
+	}
+	device_failed = 0;
+}
+
+static int open_device(libusb_context *ctx)
+{
+	int ret;
 	unsigned char cdata[0x53];
 
-	libusb_init(&ctx);
-	libusb_set_debug(ctx, 0);
-	
-	h = libusb_open_device_with_vid_pid(ctx, vendor_id, product_id);
+	h = libusb_open_device_with_vid_pid(ctx, VENDOR_ID, PRODUCT_ID);
 	if (h == NULL) {
-		fprintf(stderr, "Failed to open DMM device\n");
-		libusb_exit(ctx);
-		return;
+		return -1;
 	}
 
 	libusb_detach_kernel_driver(h, 0);
@@ -53,57 +161,115 @@ void read_device(void)
 
 	memset(cdata, 0, sizeof(cdata));
 
-	ret = libusb_control_transfer(h, 0x80, 0x06, 0x0200, 0, cdata, 0x22, 0); 
+	ret = libusb_control_transfer(h, 0x80, 0x06, 0x0200, 0, cdata, 0x22, 0);
 	if (ret != 0x22) {
 		fprintf(stderr, "Failed transfer 1\n");
 		goto failed;
 	}
-	ret = libusb_control_transfer(h, 0x80, 0x06, 0x0200, 0, cdata, 0x22, 0); 
+	ret = libusb_control_transfer(h, 0x80, 0x06, 0x0200, 0, cdata, 0x22, 0);
 	if (ret != 0x22) {
 		fprintf(stderr, "Failed transfer 2\n");
 		goto failed;
 	}
-	ret = libusb_control_transfer(h, 0x21, 0x0a, 0x0000, 0, cdata, 0, 0); 
+	ret = libusb_control_transfer(h, 0x21, 0x0a, 0x0000, 0, cdata, 0, 0);
 	if (ret != 0) {
 		fprintf(stderr, "Failed transfer 3\n");
 		goto failed;
 	}
-	ret = libusb_control_transfer(h, 0x81, 0x06, 0x2200, 0, cdata, 0x53, 0); 
+	ret = libusb_control_transfer(h, 0x81, 0x06, 0x2200, 0, cdata, 0x53, 0);
 	if (ret != 19) {
 		fprintf(stderr, "Failed transfer 4\n");
 		goto failed;
 	}
 
-	while (1) {
-		int i;
-
-		memset(data, 0, sizeof(data));
-		ret = libusb_interrupt_transfer(h, 0x81, data, sizeof(data), &nread, 10000);
-		if (ret != 0 || nread != 14) {
-			fprintf(stderr, "libusb_interrupt_transfer ret=%d nread=%d\n", ret, nread);
-			goto failed;
-		}
-		printf("00 ");
-		for (i=0;i<14;i++) {
-			printf("%02X ", data[i]);
-		}
-		if (printf("\n") < 0 || 
-		    fflush(stdout) != 0) {
-			exit(1);
-		}
+	transfer = libusb_alloc_transfer(0);
+	if (transfer == NULL) {
+		goto failed;
+	}
+	memset(data, 0, sizeof(data));
+	libusb_fill_interrupt_transfer(transfer, h, 0x81, data, sizeof(data),
+				       read_callback, NULL, 0);
+	if (libusb_submit_transfer(transfer) != 0) {
+		fprintf(stderr, "Failed to submit transfer\n");
+		goto failed;
 	}
-	
+	transfer_active = 1;
+
+	/* don't count the time it was away
+	   as the meter being slow to send */
+	last_data_ms = now_ms();
+	print_line("# status %s\n", "connected");
+	return 0;
+
 failed:
+	if (transfer != NULL) {
+		libusb_free_transfer(transfer);
+		transfer = NULL;
+	}
 	libusb_close(h);
-	libusb_exit(ctx);
+	h = NULL;
+	return -1;
 }
 
-
 int main(int argc, char *argv[])
 {
+	libusb_context *ctx;
+	long long next_heartbeat, next_attempt = 0, lost_ms;
+
+	if (libusb_init(&ctx) != 0) {
+		fprintf(stderr, "Failed to initialise libusb\n");
+		return 1;
+	}
+	libusb_set_debug(ctx, 0);
+
+	have_hotplug = libusb_has_capability(LIBUSB_CAP_HAS_HOTPLUG) &&
+		libusb_hotplug_register_callback(ctx,
+			LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED | LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT,
+			0, VENDOR_ID, PRODUCT_ID, LIBUSB_HOTPLUG_MATCH_ANY,
+			hotplug_callback, NULL, NULL) == LIBUSB_SUCCESS;
+
+	print_line("# status %s\n", "disconnected");
+	lost_ms = now_ms();
+	next_heartbeat = lost_ms + HEARTBEAT_MS;
+
 	while (1) {
-		read_device();
-		sleep(1);
+		struct timeval tv = { 0, RECONNECT_MS * 1000 };
+		long long now;
+
+		if (device_failed) {
+			/* try again straight away, it
+			   may only have been a glitch */
+			close_device(ctx);
+			next_attempt = 0;
+			lost_ms = now_ms();
+		}
+
+		now = now_ms();
+		if (h == NULL && (device_arrived || now >= next_attempt)) {
+			device_arrived = 0;
+			if (open_device(ctx) != 0) {
+				/* with hotplug we hear when it comes
+				   back, but still try now and then.
+				   Without, keep trying hard for a
+				   while in case it was a glitch */
+				if (!have_hotplug && now - lost_ms < FAST_RECONNECT_MS) {
+					next_attempt = now + RECONNECT_MS;
+				} else {
+					next_attempt = now + HEARTBEAT_MS;
+				}
+			}
+		}
+
+		libusb_handle_events_timeout_completed(ctx, &tv, NULL);
+
+		now = now_ms();
+		if (now >= next_heartbeat) {
+			printf("# heartbeat %lld\n", last_data_ms < 0 ? -1 : now - last_data_ms);
+			if (fflush(stdout) != 0) {
+				exit(1);
+			}
+			next_heartbeat = now + HEARTBEAT_MS;
+		}
 	}
 	return 0;
 }
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+
+###################################
+# pyRoast - automatic roast event detection
+# Released under GNU GPLv3 or later
+#
+# first crack is endothermic, so the rate of
+# rise dips sharply for a while once the beans
+# reach it. Cutting the power does that too, so
+# when the power is known the dip looked for is
+# in the rise the thermal model can't explain
+# from the power. Unloading drops the temperature
+# the probe sees. CrackDetector watches for
+# both one sample at a time, DetectEvents
+# finds the same events in a whole saved
+# roast at once.
+
+import collections
+import getopt
+import os
+import sys
+
+import numpy as np
+
+from thermal import ThermalModel
+
+# the rate of rise is measured over this many seconds
+gRoRWindow = 30.0
+# and its slope over this many seconds
+gSlopeWindow = 20.0
+
+# first crack is looked for in this temperature range,
+# as a rate of rise falling faster than this many
+# degrees/minute per minute for gHold seconds
+gFirstCrackTemps = (180.0, 230.0)
+gFirstCrackSlope = -5.0
+gHold = 5.0
+
+# unload is the temperature falling faster than this
+# many degrees/minute, once it has been above gUnloadTemp
+gUnloadRoR = -20.0
+gUnloadTemp = 150.0
+gUnloadHold = 2.0
+
+
+############################
+# the value furthest back in a window
+# of (time, value) pairs, after
+# dropping anything older than span
+def _Oldest(window, t, v, span):
+    window.append((t, v))
+    while t - window[0][0] > span:
+        window.popleft()
+    return window[0]
+
+
+############################
+# runs the thermal model on the power
+# actually used, pulled back onto each
+# measurement, and keeps a running total
+# of how far the measurements come out
+# from what it expected
+class _ModelTracker:
+
+    def __init__(self, model):
+        self.model = model
+        self.state = None
+        self.last_time = None
+        self.unexplained = 0.0
+
+    def update(self, t, temp, power):
+        if self.state is None:
+            self.state = self.model.initial_state(temp)
+            self.last_time = t
+            return self.unexplained
+        while t - self.last_time >= self.model.step:
+            self.model.advance(self.state, power, self.model.step)
+            self.last_time += self.model.step
+        miss = temp - self.state[-1]
+        self.unexplained += miss
+        self.state += miss
+        return self.unexplained
+
+
+class CrackDetector:
+
+    def __init__(self, model=None):
+        if model is None:
+            model = ThermalModel()
+        self.tracker = _ModelTracker(model)
+        self.temps = collections.deque()
+        self.rises = collections.deque()
+        self.rors = collections.deque()
+        self.max_temp = 0.0
+        self.dip_since = None
+        self.drop_since = None
+        self.found = set()
+
+    ############################
+    # feed in one sample, time in seconds,
+    # with the power in use if known, and
+    # get back the names of any events it
+    # completes. Amortised O(1).
+    def feed(self, t, temp, power=None):
+        events = []
+        self.max_temp = max(self.max_temp, temp)
+        rise = temp if power is None else self.tracker.update(t, temp, power)
+        t0, temp0 = _Oldest(self.temps, t, temp, gRoRWindow)
+        t0, rise0 = _Oldest(self.rises, t, rise, gRoRWindow)
+        if t - t0 < gRoRWindow / 2:
+            return events
+        ror = (temp - temp0) * 60.0 / (t - t0)
+        dip_ror = (rise - rise0) * 60.0 / (t - t0)
+
+        t1, ror1 = _Oldest(self.rors, t, dip_ror, gSlopeWindow)
+        if t - t1 >= gSlopeWindow / 2 and "First crack" not in self.found and "Unload" not in self.found:
+            slope = (dip_ror - ror1) * 60.0 / (t - t1)
+            if gFirstCrackTemps[0] <= temp <= gFirstCrackTemps[1] and slope < gFirstCrackSlope:
+                if self.dip_since is None:
+                    self.dip_since = t
+                if t - self.dip_since >= gHold:
+                    self.found.add("First crack")
+                    events.append("First crack")
+            else:
+                self.dip_since = None
+
+        if "Unload" not in self.found:
+            if self.max_temp > gUnloadTemp and ror < gUnloadRoR:
+                if self.drop_since is None:
+                    self.drop_since = t
+                if t - self.drop_since >= gUnloadHold:
+                    self.found.add("Unload")
+                    events.append("Unload")
+            else:
+                self.drop_since = None
+        return events
+
+
+############################
+# for each sample, the earliest sample
+# no more than span seconds before it
+def _WindowStart(t, span):
+    return np.searchsorted(t, t - span, side='left')
+
+
+############################
+# for each sample, how long cond has
+# been true up to and including it
+def _HeldFor(t, cond):
+    idx = np.arange(len(t))
+    last_false = np.maximum.accumulate(np.where(cond, -1, idx))
+    start = np.minimum(last_false + 1, len(t) - 1)
+    return np.where(cond, t - t[start], -1.0)
+
+
+############################
+# the same detection as CrackDetector,
+# for a whole roast at once, with the
+# power for each sample if known. Returns
+# {event name: time in seconds}.
+def DetectEvents(times, temps, powers=None, model=None):
+    t = np.asarray(times, dtype=float)
+    temp = np.asarray(temps, dtype=float)
+    events = {}
+    if len(t) == 0:
+        return events
+
+    # the model has to be run one sample
+    # at a time, just as when streaming
+    rise = temp
+    if powers is not None:
+        tracker = _ModelTracker(ThermalModel() if model is None else model)
+        rise = np.array([tracker.update(ti, tempi, p) for ti, tempi, p in zip(times, temps, powers)])
+
+    j = _WindowStart(t, gRoRWindow)
+    span = t - t[j]
+    has_ror = span >= gRoRWindow / 2
+    ror = np.where(has_ror, (temp - temp[j]) * 60.0 / np.where(span > 0, span, 1.0), 0.0)
+    dip_ror = np.where(has_ror, (rise - rise[j]) * 60.0 / np.where(span > 0, span, 1.0), 0.0)
+
+    # the RoR history only starts once
+    # there is a RoR to put in it
+    rt = t[has_ror]
+    k = _WindowStart(rt, gSlopeWindow)
+    rspan = rt - rt[k]
+    slope = np.full(len(t), np.nan)
+    slope[has_ror] = np.where(rspan >= gSlopeWindow / 2,
+                              (dip_ror[has_ror] - dip_ror[has_ror][k]) * 60.0 / np.where(rspan > 0, rspan, 1.0),
+                              np.nan)
+
+    max_temp = np.maximum.accumulate(temp)
+    drop = has_ror & (max_temp > gUnloadTemp) & (ror < gUnloadRoR)
+    unload = np.flatnonzero(_HeldFor(t, drop) >= gUnloadHold)
+    end = unload[0] + 1 if len(unload) else len(t)
+    if len(unload):
+        events["Unload"] = float(t[unload[0]])
+
+    # the streaming detector only starts counting a dip
+    # once there is a slope to look at
+    valid = ~np.isnan(slope)
+    dip = valid & (temp >= gFirstCrackTemps[0]) & (temp <= gFirstCrackTemps[1]) & \
+        (np.where(valid, slope, 0.0) < gFirstCrackSlope)
+    first = np.flatnonzero(_HeldFor(t, dip)[:end] >= gHold)
+    if len(first):
+        events["First crack"] = float(t[first[0]])
+    return events
+
+
+#############################
+def usage():
+    print(
+        """
+Usage: crackdetect.py [options] LOG|DIR...
+Find first crack and unload in saved roasts, and compare
+them with the events recorded by hand.
+Options:
+  -h                   show this help
+  --tolerance SEC      count a detection within SEC of the manual event as a hit (default 30)
+  --roaster NAME       use the thermal model fitted by thermalfit.py for NAME to tell
+                       first crack from power changes, in roasts that logged power
+  --models FILE        where --roaster models are kept (default thermal_models.json)
+  --label DIR          write copies of the roasts with detected events added to DIR,
+                       under the same subdirectories. DIR must not be within an input
+"""
+    )
+
+
+if __name__ == "__main__":
+    from roastcsv import FindRoasts, ReadRoast, RoastName
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "tolerance=", "label=", "roaster=", "models="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+
+    tolerance = 30.0
+    label_dir = None
+    roaster_name = None
+    models_file = "thermal_models.json"
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif o == "--tolerance":
+            tolerance = float(a)
+        elif o == "--label":
+            label_dir = a
+        elif o == "--roaster":
+            roaster_name = a
+        elif o == "--models":
+            models_file = a
+    if not args:
+        usage()
+        sys.exit(2)
+
+    model = None
+    if roaster_name:
+        from thermal import LoadModel
+        try:
+            model = LoadModel(models_file, roaster_name)
+        except (OSError, KeyError, ValueError) as err:
+            reason = err.args[0] if isinstance(err, KeyError) else err
+            print(f"Unable to load thermal model for {roaster_name}: {reason}")
+            sys.exit(2)
+    if label_dir:
+        # the copies must not land on, or be
+        # found among, the roasts being read
+        out = os.path.realpath(label_dir)
+        for path in args:
+            inside = os.path.realpath(path if os.path.isdir(path) else os.path.dirname(path) or ".")
+            if out == inside or out.startswith(inside + os.sep):
+                print(f"--label {label_dir} is within the input {path}")
+                sys.exit(2)
+        os.makedirs(label_dir, exist_ok=True)
+
+    names = ["First crack", "Unload"]
+    hits = dict.fromkeys(names, 0)
+    misses = dict.fromkeys(names, 0)
+    extra = dict.fromkeys(names, 0)
+    errors = {name: [] for name in names}
+    for fname in FindRoasts(args):
+        rows = list(ReadRoast(fname))
+        if not rows:
+            continue
+        start = rows[0][0]
+        manual = {}
+        for t, temp, event, power in rows:
+            if event and event not in manual:
+                manual[event] = t - start
+        powers = [r[3] for r in rows]
+        if None in powers:
+            powers = None
+        found = DetectEvents([r[0] - start for r in rows], [r[1] for r in rows], powers, model)
+
+        report = []
+        for name in names:
+            if name in manual and name in found:
+                err = found[name] - manual[name]
+                errors[name].append(err)
+                if abs(err) <= tolerance:
+                    hits[name] += 1
+                else:
+                    misses[name] += 1
+                report.append(f"{name} {err:+.0f}s")
+            elif name in manual:
+                misses[name] += 1
+                report.append(f"{name} missed")
+            elif name in found:
+                extra[name] += 1
+                report.append(f"{name} at {found[name]:.0f}s (not labelled)")
+        print(f"{fname}: {', '.join(report)}")
+
+        if label_dir:
+            # detected events go on the sample they
+            # were detected at, unless already labelled
+            at = {found[name]: name for name in found if name not in manual}
+            lname = os.path.join(label_dir, RoastName(fname, args))
+            if os.path.realpath(lname) == os.path.realpath(fname):
+                print(f"--label {label_dir} would overwrite {fname}")
+                sys.exit(2)
+            os.makedirs(os.path.dirname(lname), exist_ok=True)
+            with open(lname, "w") as f:
+                f.write("Time,Temperature,Event,Power\n")
+                for t, temp, event, power in rows:
+                    if not event and t - start in at:
+                        event = at[t - start] + " (auto)"
+                    f.write(f'{t},{temp},{event},{"" if power is None else power}\n')
+
+    for name in names:
+        errs = errors[name]
+        mae = sum(abs(e) for e in errs) / len(errs) if errs else 0.0
+        print(f"{name}: {hits[name]} within {tolerance:.0f}s, {misses[name]} missed or late, "
+              f"{extra[name]} in unlabelled roasts, mean abs error {mae:.1f}s")
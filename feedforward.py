@@ -0,0 +1,114 @@
+###################################
+# pyRoast - feedforward power schedules
+# Released under GNU GPLv3 or later
+#
+# the thermal model is linear, so the temperature
+# for any power schedule is the free response of
+# the roaster plus a weighted sum of the response
+# to power held over each block. Compiling a
+# profile finds the block powers, within 0-100%,
+# whose predicted temperature best follows it.
+# The live controller then only has to correct
+# for where the model is wrong.
+
+import collections
+import hashlib
+
+import numpy as np
+
+# the last few compiled schedules,
+# by profile and model
+gCacheSize = 4
+_cache = collections.OrderedDict()
+
+
+class PowerSchedule:
+
+    def __init__(self, times, powers, predicted):
+        # powers[i] is held from times[i] until times[i + 1]
+        self.times = times
+        self.powers = powers
+        # the model's temperature after each step
+        self.predicted = predicted
+
+    ############################
+    # the scheduled power at t seconds,
+    # holding the last block after the end
+    def power(self, t):
+        i = np.searchsorted(self.times, t, side='right') - 1
+        return float(self.powers[min(max(i, 0), len(self.powers) - 1)])
+
+
+############################
+# the response of the last cell to one block of
+# unit power from an idle roaster, over steps
+def _BlockResponse(model, block_steps, steps):
+    unit = np.zeros((1, steps))
+    unit[0, :block_steps] = 1.0
+    return model.rollout(model.initial_state(), unit)[0] - model.base_temp
+
+
+############################
+# minimise 0.5 p'Hp - f'p for 0 <= p <= pmax,
+# by accelerated projected gradient
+def _BoxQP(H, f, p, pmax, iterations=3000, tol=1e-4):
+    step = 1.0 / np.linalg.eigvalsh(H)[-1]
+    y = p.copy()
+    theta = 1.0
+    for _ in range(iterations):
+        p_next = np.clip(y - step * (H @ y - f), 0.0, pmax)
+        theta_next = (1.0 + np.sqrt(1.0 + 4.0 * theta * theta)) / 2.0
+        y = p_next + ((theta - 1.0) / theta_next) * (p_next - p)
+        change = np.max(np.abs(p_next - p))
+        p = p_next
+        theta = theta_next
+        if change < tol:
+            break
+    return p
+
+
+############################
+# work out the power schedule for a profile,
+# given as times in seconds and temperatures.
+# Power changes every block seconds, and
+# move_weight trades tracking against
+# jumps in power between blocks.
+def CompileSchedule(model, times, temps, block=2.0, power_max=100.0, move_weight=0.01):
+    times = np.asarray(times, dtype=float)
+    temps = np.asarray(temps, dtype=float)
+    key = hashlib.sha1(times.tobytes() + temps.tobytes() +
+                       repr((model, block, power_max, move_weight)).encode()).hexdigest()
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    block_steps = max(int(round(block / model.step)), 1)
+    blocks = max(int(np.ceil((times[-1] - times[0]) / (block_steps * model.step))), 1)
+    steps = blocks * block_steps
+    step_times = times[0] + model.step * np.arange(1, steps + 1)
+    target = np.interp(step_times, times, temps)
+
+    # the roaster starts at the profile's first temperature
+    # and cools towards the base temperature unpowered
+    free = model.rollout(model.initial_state(temps[0]), np.zeros((1, steps)))[0]
+
+    # the response to each block is the response
+    # to the first one, shifted along
+    g = _BlockResponse(model, block_steps, steps)
+    lag = np.arange(steps)[:, np.newaxis] - block_steps * np.arange(blocks)[np.newaxis, :]
+    G = np.where(lag >= 0, g[np.maximum(lag, 0)], 0.0)
+
+    D = np.diff(np.eye(blocks), axis=0)
+    H = G.T @ G + move_weight * steps * (D.T @ D)
+    f = G.T @ (target - free)
+
+    # start from the power that would hold each
+    # target temperature steady
+    hold = model.k * (target[block_steps - 1::block_steps] - model.base_temp) / model.r
+    powers = _BoxQP(H, f, np.clip(hold, 0.0, power_max), power_max)
+
+    schedule = PowerSchedule(times[0] + block_steps * model.step * np.arange(blocks), powers, free + G @ powers)
+    _cache[key] = schedule
+    while len(_cache) > gCacheSize:
+        _cache.popitem(last=False)
+    return schedule
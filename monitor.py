@@ -0,0 +1,282 @@
+###################################
+# pyRoast - live remote monitoring
+# Released under GNU GPLv3 or later
+#
+# a small HTTP/WebSocket server running on
+# its own thread and event loop. tick() hands
+# each sample over without waiting; the
+# server encodes it once as a delta from the
+# previous sample and queues the same frame
+# for every viewer. A viewer that falls too
+# far behind has its queue dropped and gets
+# a fresh snapshot instead.
+
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import struct
+import threading
+
+from roastlog import log
+
+# how many frames a slow viewer may have queued
+gQueueLimit = 64
+# how many samples a new viewer is sent
+gHistorySize = 4 * 60 * 60 * 2
+
+_WS_MAGIC = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+############################
+# a WebSocket text frame, as
+# sent from the server
+def WebSocketFrame(text):
+    data = text.encode()
+    if len(data) < 126:
+        header = struct.pack("!BB", 0x81, len(data))
+    elif len(data) < 65536:
+        header = struct.pack("!BBH", 0x81, 126, len(data))
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, len(data))
+    return header + data
+
+
+def _Json(obj):
+    return json.dumps(obj, separators=(",", ":"))
+
+
+class _Viewer:
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.frames = collections.deque()
+        self.wakeup = asyncio.Event()
+        self.resync = False
+
+
+class MonitorServer:
+
+    def __init__(self, host="127.0.0.1", port=8080):
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.server = None
+        self.viewers = set()
+        # the last sample sent, in ms, tenths of a degree and percent
+        self.last = (0, 0, 0)
+        self.history = collections.deque(maxlen=gHistorySize)
+        self.events = []
+        self._ready = threading.Event()
+        self._error = None
+
+    ############################
+    # start serving on a background thread,
+    # raising whatever stopped it listening
+    def start(self):
+        threading.Thread(target=self._run, name="MonitorServer", daemon=True).start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    ############################
+    # these are called from the GUI thread,
+    # and only hand the data to the server
+    def publish(self, t, temp, power):
+        self.loop.call_soon_threadsafe(self._sample, int(round(t * 1000)), int(round(temp * 10)), int(round(power)))
+
+    def event(self, t, name):
+        self.loop.call_soon_threadsafe(self._event, int(round(t * 1000)), name)
+
+    def reset(self):
+        self.loop.call_soon_threadsafe(self._reset)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._connection, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            log.info("monitor listening on http://%s:%d/", self.host, self.port)
+        except Exception as err:
+            self._error = err
+            self.loop.close()
+            self.loop = None
+            return
+        finally:
+            self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            # dropping the connections lets each
+            # viewer's task finish by itself
+            self.server.close()
+            for viewer in self.viewers:
+                viewer.writer.transport.abort()
+            tasks = asyncio.all_tasks(self.loop)
+            if tasks:
+                self.loop.run_until_complete(asyncio.wait(tasks, timeout=1.0))
+            self.loop.close()
+
+    ############################
+    # everything below runs on the
+    # server's event loop
+    def _sample(self, t, temp, power):
+        lt, ltemp, lpower = self.last
+        msg = {"d": [t - lt, temp - ltemp]}
+        if power != lpower:
+            msg["p"] = power
+        self.last = (t, temp, power)
+        self.history.append(self.last)
+        self._broadcast(WebSocketFrame(_Json(msg)))
+
+    def _event(self, t, name):
+        self.events.append((t, name))
+        self._broadcast(WebSocketFrame(_Json({"e": name, "t": t})))
+
+    def _reset(self):
+        self.last = (0, 0, 0)
+        self.history.clear()
+        del self.events[:]
+        for viewer in self.viewers:
+            viewer.frames.clear()
+            viewer.resync = True
+            viewer.wakeup.set()
+
+    def _broadcast(self, frame):
+        for viewer in self.viewers:
+            if viewer.resync:
+                continue
+            if len(viewer.frames) >= gQueueLimit:
+                viewer.frames.clear()
+                viewer.resync = True
+            else:
+                viewer.frames.append(frame)
+            viewer.wakeup.set()
+
+    ############################
+    # the whole session so far, which
+    # the deltas that follow build on
+    def _snapshot(self):
+        return WebSocketFrame(_Json({"s": list(self.history), "ev": self.events}))
+
+    async def _connection(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode("latin-1").split("\r\n")
+        path = lines[0].split(" ")[1] if len(lines[0].split(" ")) > 1 else "/"
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+
+        if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+            await self._websocket(reader, writer, headers)
+        elif path == "/":
+            body = gPage.encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+            await self._close(writer)
+        else:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await self._close(writer)
+
+    async def _websocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1(headers.get("sec-websocket-key", "").encode() + _WS_MAGIC).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        viewer = _Viewer(writer)
+        viewer.resync = True
+        viewer.wakeup.set()
+        self.viewers.add(viewer)
+        # viewers never send anything that matters,
+        # so just read until they go away
+        closed = asyncio.ensure_future(self._discard(reader))
+        try:
+            while not closed.done():
+                waiter = asyncio.ensure_future(viewer.wakeup.wait())
+                await asyncio.wait([waiter, closed], return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                viewer.wakeup.clear()
+                if viewer.resync:
+                    viewer.resync = False
+                    writer.write(self._snapshot())
+                while viewer.frames:
+                    writer.write(viewer.frames.popleft())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            closed.cancel()
+            await self._close(writer)
+
+    async def _discard(self, reader):
+        try:
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+
+    async def _close(self, writer):
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+gPage = """<!DOCTYPE html>
+<html><head><title>pyRoast</title>
+<style>body{font-family:sans-serif} canvas{border:1px solid #888}</style></head>
+<body>
+<h3>pyRoast <span id="temp"></span> <span id="power"></span></h3>
+<canvas id="plot" width="850" height="300"></canvas>
+<ul id="events"></ul>
+<script>
+var samples = [], events = [], last = [0, 0, 0];
+var plot = document.getElementById("plot"), ctx = plot.getContext("2d");
+function draw() {
+  ctx.clearRect(0, 0, plot.width, plot.height);
+  var tmax = Math.max(30 * 60000, last[0]);
+  ctx.strokeStyle = "blue";
+  ctx.beginPath();
+  samples.forEach(function(s, i) {
+    var x = s[0] / tmax * plot.width, y = plot.height - s[1] / 3000 * plot.height;
+    if (i == 0) ctx.moveTo(x, y); else ctx.lineTo(x, y);
+  });
+  ctx.stroke();
+  document.getElementById("temp").textContent = (last[1] / 10).toFixed(1) + "\\u00b0C";
+  document.getElementById("power").textContent = last[2] + "%";
+  document.getElementById("events").innerHTML = events.map(function(e) {
+    var s = Math.round(e[0] / 1000);
+    return "<li>" + Math.floor(s / 60) + ":" + ("0" + s % 60).slice(-2) + " " + e[1] + "</li>";
+  }).join("");
+}
+var ws = new WebSocket("ws://" + location.host + "/ws");
+ws.onmessage = function(m) {
+  var msg = JSON.parse(m.data);
+  if (msg.s) {
+    samples = msg.s; events = msg.ev;
+    last = samples.length ? samples[samples.length - 1] : [0, 0, 0];
+  } else if (msg.d) {
+    last = [last[0] + msg.d[0], last[1] + msg.d[1], "p" in msg ? msg.p : last[2]];
+    samples.push(last);
+  } else if (msg.e) {
+    events.push([msg.t, msg.e]);
+  }
+  draw();
+};
+</script>
+</body></html>
+"""
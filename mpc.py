@@ -0,0 +1,76 @@
+###################################
+# pyRoast - model predictive power control
+# Released under GNU GPLv3 or later
+#
+# each control step tries every combination
+# of a few power levels held over successive
+# blocks of the horizon, predicts the
+# temperature for all of them at once with
+# the thermal model, and picks the cheapest
+
+import itertools
+
+import numpy as np
+
+from thermal import ThermalModel
+
+
+class ModelPredictiveController:
+
+    def __init__(self, model=None, horizon=60.0, blocks=(1, 2, 3), levels=np.arange(0, 101, 5),
+                 move_weight=0.02):
+        if model is None:
+            model = ThermalModel()
+        self.model = model
+        self.move_weight = move_weight
+        self.steps = int(round(horizon / model.step))
+
+        # split the horizon into blocks in the given ratio,
+        # with power held constant within each block
+        bounds = np.round(np.cumsum((0,) + tuple(blocks)) / sum(blocks) * self.steps).astype(int)
+        basis = np.zeros((len(blocks), self.steps))
+        for b in range(len(blocks)):
+            basis[b, bounds[b]:bounds[b + 1]] = 1.0
+
+        # every combination of power levels across the blocks
+        self.candidates = np.array(list(itertools.product(levels, repeat=len(blocks))), dtype=float)
+        self.powers = self.candidates @ basis
+
+        # the model is linear, so the forced response of every
+        # candidate is a weighted sum of the response to each
+        # block at unit power from an idle roaster
+        base = model.initial_state()
+        self.response = model.rollout(base, basis) - model.base_temp
+        self.times = model.step * np.arange(1, self.steps + 1)
+
+        self.state = None
+        self.last_time = None
+
+    ############################
+    # bring the internal model up to
+    # time t, given the power that has
+    # been applied since the last call,
+    # then pull it onto the measurement
+    def observe(self, t, temp, power):
+        if self.state is None:
+            self.state = self.model.initial_state(temp)
+            self.last_time = t
+            return
+        while t - self.last_time >= self.model.step:
+            self.model.advance(self.state, power, self.model.step)
+            self.last_time += self.model.step
+        self.state += temp - self.state[-1]
+
+    ############################
+    # choose the power for now, given
+    # a function mapping an array of
+    # times (in seconds) to targets
+    def control(self, t, target_fn, current_power):
+        free = self.model.rollout(self.state, np.zeros((1, self.steps)))[0]
+        predicted = free + self.candidates @ self.response
+        target = np.asarray(target_fn(t + self.times), dtype=float)
+
+        cost = np.mean((predicted - target) ** 2, axis=1)
+        moves = np.abs(np.diff(self.powers, axis=1, prepend=current_power))
+        cost += self.move_weight * np.sum(moves, axis=1)
+        return float(self.candidates[np.argmin(cost), 0])
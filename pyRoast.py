@@ -1,14 +1,28 @@
 #!/usr/bin/env python3
 
-import csv
+import bisect
 import getopt
+import logging
+import math
 import os
 import signal
 import subprocess
+import sys
+import threading
 import time
 
 import select
-import serial
+
+startup_time = time.perf_counter()
+startup_marks = []
+
+
+#############################
+# note how long startup has
+# taken to get to this point
+def StartupMark(label):
+    startup_marks.append((label, time.perf_counter()))
+
 
 ###################################
 # pyRoast - Coffee roasting profile
@@ -16,7 +30,14 @@ import serial
 # Released under GNU GPLv3 or later
 import wx
 
+StartupMark("import wx")
+
 from pyRoastUI import *
+from roastclock import MonotonicClock, VirtualClock
+from roastcsv import ReadRoast, gHistorySuffix, gVirtualPrefix
+from roastlog import log, SetupLogging, ShutdownLogging, Trace
+
+StartupMark("import pyRoastUI")
 
 # a few constants
 gTempArraySize = 5
@@ -34,6 +55,22 @@ profile_file = None
 temp2_dev = None
 temp2 = None
 verbose = False
+log_file = None
+trace_sources = []
+import_profile = False
+dmm = None
+dmm_file = None
+dmm_status = None
+dmm_heartbeat = None
+dmm_stalled = False
+# readings more than this many ms apart, or heartbeats
+# more than this many seconds apart, mean trouble
+gDMMStallMs = 2000
+gDMMHeartbeatTimeout = 3.0
+monitor_port = None
+monitor = None
+autodetect = False
+crack_detector = None
 
 PID_integral = 0
 PID_previous_error = 0
@@ -46,13 +83,36 @@ current_power = 100
 sim_last_time = 0
 sim_last_temp = 0
 sim_base_temp = 29.0
+thermal_model = None
+roaster_name = None
+models_file = "thermal_models.json"
+
+control_mode = "roc"
+mpc_controller = None
+mpc_horizon = 60.0
+mpc_lastt = 0
+# with --feedforward, the power compiled from the
+# profile plus this much % per degree below target
+ff_schedule = None
+ff_gain = 1.0
+ff_lastt = 0
+
+clock = None
+virtual = False
+virtual_duration = None
+
+# samples older than history_window minutes are
+# rolled up into coarser tiers, all kept within
+# history_memory MB
+History = None
+history_window = None
+history_memory = 4
 
 
 ######################
 # get the elapsed time
 def ElapsedTime():
-    global StartTime
-    return time_speedup * (time.time() - StartTime)
+    return clock.elapsed()
 
 
 #############################
@@ -67,6 +127,9 @@ def TimeString():
 # window, prefixed by the time
 def AddMessage(m):
     ui.temp_readout.write(f"{TimeString()} {m}\n")
+    # the text itself is the template, so the
+    # rate limit only holds back true repeats
+    log.info(m)
 
 
 def DebugMessage(m):
@@ -78,10 +141,21 @@ def DebugMessage(m):
 ############################
 # reset the plot
 def bReset(event):
-    global StartTime, CurrentTemperature, MaxTemperature, sim_last_time, TemperatureArray
-    StartTime = time.time()
+    global CurrentTemperature, MaxTemperature, sim_last_time, TemperatureArray
+    global mpc_controller, mpc_lastt, crack_detector, ff_lastt
+    clock.reset()
     sim_last_time = 0
+    mpc_controller = None
+    mpc_lastt = 0
+    ff_lastt = 0
     dmmPlot.set_data([], [])
+    History.clear()
+    RoastEvents.clear()
+    if monitor is not None:
+        monitor.reset()
+    if autodetect:
+        from crackdetect import CrackDetector
+        crack_detector = CrackDetector(GetThermalModel())
     CurrentTemperature = 0
     MaxTemperature = 0
     TemperatureArray = []
@@ -102,6 +176,9 @@ def bEvent(estring):
     ui.temperature_plot.axes.annotate(estring, xy=(elapsed, CurrentTemperature), xytext=(elapsed + 1, ytext),
                                       arrowprops=dict(facecolor='black', shrink=0.05, width=0.5, headwidth=2.5,
                                                       alpha=0.7), )
+    RoastEvents.append((elapsed, estring))
+    if monitor is not None:
+        monitor.event(elapsed * 60.0, estring)
     AddMessage(estring)
 
 
@@ -125,17 +202,6 @@ def bUnload(event):
     bEvent("Unload")
 
 
-###########################
-# useful fn to see if a string
-# is a number
-def isNumber(s) -> bool:
-    try:
-        v = float(s)
-    except Exception:
-        return False
-    return True
-
-
 ###########################
 # work out the profile temperature
 # given a time
@@ -154,21 +220,35 @@ def ProfileTemperature() -> float:
 # load an existing CSV
 # as a profile plot
 def LoadProfile(filename):
-    # TODO understand use of label variable.
     global LoadedProfile
-    reader = csv.reader(open(filename))
     newx = []
     newy = []
-    for p in reader:
-        if isNumber(p[0]):
-            label = p[2]
-            if isNumber(label):
-                label = ""
-            newx.append(float(p[0]) / 60.0)
-            newy.append(float(p[1]))
-            # LoadedProfile.addPoint(float(p[0]) / 60.0, float(p[1]), label)
+    for t, temp, event, power in ReadRoast(filename):
+        newx.append(t / 60.0)
+        newy.append(temp)
     LoadedProfile.set_data(newx, newy)
     ui.temperature_plot.draw()
+    if control_mode == "feedforward":
+        CompileProfile(newx, newy)
+
+
+###########################
+# work out the power schedule
+# that follows the loaded profile
+def CompileProfile(times, temps):
+    global ff_schedule
+    from feedforward import CompileSchedule
+    ff_schedule = None
+    if len(times) < 2:
+        return
+    start = time.monotonic()
+    ff_schedule = CompileSchedule(GetThermalModel(), [t * 60.0 for t in times], temps)
+    AddMessage(f"Compiled {len(ff_schedule.powers)} step power schedule")
+    # wall clock timing would make virtual
+    # sessions log differently every run
+    if not virtual:
+        log.debug("power schedule compile time", extra={"fields": {
+            "ms": round((time.monotonic() - start) * 1000)}})
 
 
 ###########################
@@ -190,8 +270,19 @@ def bLoadProfile(event):
 ###########################
 # save the data
 def bSave(event):
-    points = dmmPlot.get_data()
-    points = list(zip(points[0], points[1]))
+    points = History.recent()
+    old = History.history()
+    # each event goes on the first sample taken
+    # at or after it, and events from before the
+    # full resolution samples go in the history
+    labels = {}
+    old_labels = {}
+    for etime, estring in RoastEvents:
+        etime *= 60.0
+        if len(old["t"]) and (len(points) == 0 or etime < points["t"][0]):
+            old_labels[min(bisect.bisect_left(old["t"], etime), len(old["t"]) - 1)] = estring
+        elif len(points):
+            labels[min(bisect.bisect_left(points["t"], etime), len(points) - 1)] = estring
     fname = str(ui.file_entry_box.GetValue())
     if fname == "":
         AddMessage("Please choose a file name")
@@ -200,12 +291,24 @@ def bSave(event):
         fname += ".csv"
     f = open(fname, 'w')
     AddMessage(f'Saving {len(points)} points to "{fname}" ')
-    f.write("Time,Temperature,Event\n")
-    for p in points:
-        f.write(f'{p[0] * 60.0},{p[1]},\n')  # What is meant to be encoded by label? is it stages?
-        # f.write(f'{p[0] * 60.0},{p[1]},"{p}"\n')  # What is meant to be encoded by label? is it stages?
+    f.write("Time,Temperature,Event,Power\n")
+    for i, p in enumerate(points):
+        f.write(f'{p["t"]},{p["temp"]},{labels.get(i, "")},{p["power"]}\n')
     f.close()
 
+    # anything rolled up goes alongside
+    # as min/max/mean per bucket
+    if len(old["t"]):
+        hname = os.path.splitext(fname)[0] + gHistorySuffix
+        AddMessage(f'Saving {len(old["t"])} older buckets to "{hname}" ')
+        with open(hname, 'w') as f:
+            f.write("Time,Samples,TempMin,TempMax,TempMean,PowerMin,PowerMax,PowerMean,Event\n")
+            for i in range(len(old["t"])):
+                f.write(f'{old["t"][i]},{old["n"][i]:g},'
+                        f'{old["temp_min"][i]},{old["temp_max"][i]},{old["temp_mean"][i]},'
+                        f'{old["power_min"][i]},{old["power_max"][i]},{old["power_mean"][i]},'
+                        f'{old_labels.get(i, "")}\n')
+
 
 #############################
 # save using a file dialog
@@ -230,12 +333,15 @@ def bSaveAs(event):
 def bQuit(event):
     global pcontrol
     # kill off the meter reader child
-    if not nodmm:
+    if dmm is not None:
         os.kill(dmm.pid, signal.SIGTERM)
     if pcontrol:
         pcontrol.write("0%\r\n")
         pcontrol.setDTR(0)
     ctimer.Stop()
+    if monitor is not None:
+        monitor.stop()
+    ShutdownLogging()
     ui.Close()
 
 
@@ -260,11 +366,43 @@ def GetTarget() -> float:
     return ProfileTemperature()
 
 
+###################################
+# the target temperatures at an
+# array of times, in seconds
+def GetTargets(times):
+    import numpy as np
+    if ui.vTarget.GetValue() != 0:
+        return np.full(len(times), ui.vTarget.GetValue())
+    x, y = LoadedProfile.get_data()
+    if len(x) == 0:
+        return np.zeros(len(times))
+    return np.interp(np.asarray(times) / 60.0, x, y)
+
+
+###################################
+# send the power chosen by a controller
+# to the heat gun, unless the slider
+# is in charge
+def SetPower(power):
+    global current_power, pcontrol
+    if ui.auto_power_chkbx.GetValue() is not True:
+        power = ui.power_slider.GetValue()
+    if int(power) != int(current_power):
+        AddMessage("power => " + str(int(power)))
+    if pcontrol is not None:
+        spower = power
+        if spower > 99:
+            spower = 99
+        pcontrol.setDTR(1)
+        pcontrol.write("%u%%\r\n" % int(spower))
+    current_power = power
+    ui.power_slider.SetValue(int(current_power))
+
+
 ###################################
 # adjust the amount of power to the heat gun
 def PowerControl():
     global CurrentTemperature, current_power
-    global pcontrol
 
     current = CurrentTemperature
     target = GetTarget()
@@ -288,18 +426,59 @@ def PowerControl():
     elif power < 0:
         power = 0
 
-    if ui.auto_power_chkbx.GetValue() is not True:
-        power = ui.power_slider.GetValue()
-    if int(power) != int(current_power):
-        AddMessage("power => " + str(int(power)))
-    if pcontrol is not None:
-        spower = power
-        if spower > 99:
-            spower = 99
-        pcontrol.setDTR(1)
-        pcontrol.write("%u%%\r\n" % int(spower))
-    current_power = power
-    ui.power_slider.SetValue(int(current_power))
+    SetPower(power)
+
+
+###################################
+# choose the power by predicting the
+# temperature over the next minute or
+# so for many power trajectories
+def MPC_PowerControl():
+    global mpc_controller, mpc_lastt
+
+    if mpc_controller is None:
+        from mpc import ModelPredictiveController
+        mpc_controller = ModelPredictiveController(GetThermalModel(), horizon=mpc_horizon)
+
+    t = ElapsedTime()
+    mpc_controller.observe(t, CurrentTemperature, current_power)
+
+    # don't change the power level more than once every 2 seconds
+    if t - mpc_lastt < 2:
+        return
+    mpc_lastt = t
+
+    power = mpc_controller.control(t, GetTargets, current_power)
+
+    SetPower(power)
+
+
+###################################
+# follow the power schedule compiled from
+# the profile, correcting for the error
+def FF_PowerControl():
+    global ff_lastt
+
+    # a manual target has no schedule
+    if ff_schedule is None or ui.vTarget.GetValue() != 0:
+        PowerControl()
+        return
+
+    t = ElapsedTime()
+    # don't change the power level more than once every 2 seconds
+    if t - ff_lastt < 2:
+        return
+    ff_lastt = t
+
+    error = GetTargets([t])[0] - CurrentTemperature
+    power = ff_schedule.power(t) + ff_gain * error
+
+    if power > 100:
+        power = 100
+    elif power < 0:
+        power = 0
+
+    SetPower(power)
 
 
 def PID_PowerControl():
@@ -367,7 +546,12 @@ def GotTemperature(temp, temp2=None):
     ui.current_temp.SetLabel(f"{CurrentTemperature:.1f}")
     ui.maximum_temp.SetLabel(f"{MaxTemperature:.1f}")
     ui.rate_of_change.SetLabel(("%.1f" + u'\N{DEGREE SIGN}' + "C/m") % RateOfChange())
-    PowerControl()
+    if control_mode == "mpc":
+        MPC_PowerControl()
+    elif control_mode == "feedforward":
+        FF_PowerControl()
+    else:
+        PowerControl()
 
 
 #################################
@@ -439,24 +623,33 @@ def RateOfChange() -> float:
     return (y2 - y1) / (x2 - x1)
 
 
+############################
+# the thermal model shared by the
+# simulator and the controllers
+def GetThermalModel():
+    global thermal_model
+    if thermal_model is None:
+        from thermal import ThermalModel, LoadModel
+        if roaster_name:
+            thermal_model = LoadModel(models_file, roaster_name)
+        else:
+            thermal_model = ThermalModel(base_temp=sim_base_temp)
+    return thermal_model
+
+
 def DeltaT(T, P, Tbase) -> float:
-    r = 0.0085
-    k = 0.0040
-    return r * P - k * (T - Tbase)
+    return GetThermalModel().delta_t(T, P, Tbase)
 
 
 ############################
 # simulate temperature profile
 def SimulateTemperature():
     global sim_last_time, sim_base_temp, current_power
-    global TempCells, NumCells
+    global TempCells
     if sim_last_time == 0:
         sim_last_time = ElapsedTime()
         GotTemperature(sim_last_temp)
-        TempCells = {}
-        NumCells = 40
-        for i in range(0, NumCells):
-            TempCells[i] = sim_base_temp
+        TempCells = GetThermalModel().initial_state()
         return
 
     t = ElapsedTime()
@@ -467,11 +660,8 @@ def SimulateTemperature():
 
     sim_last_time = t
 
-    TempCells[0] += DeltaT(TempCells[0], current_power, sim_base_temp) * elapsed
-    for i in range(1, NumCells):
-        TempCells[i] = (TempCells[i - 1] + TempCells[i]) / 2
-
-    GotTemperature(TempCells[NumCells - 1])
+    GetThermalModel().advance(TempCells, current_power, elapsed)
+    GotTemperature(float(TempCells[-1]))
 
 
 ############################
@@ -516,10 +706,15 @@ def CheckDMMInput():
     if simulate_temp:
         SimulateTemperature()
         return
-    if nodmm:
+    if nodmm or dmm_file is None:
         return
+    CheckDMMHealth()
     while select.select([dmm_file], [], [], 0)[0]:
         line = dmm_file.readline().strip(" \n\r")
+        Trace("dmm", line)
+        if line.startswith("#"):
+            DMMStatus(line[1:].split())
+            continue
         s = line.split(" ")
 
         if len(s) != 15:
@@ -545,6 +740,39 @@ def CheckDMMInput():
             AddMessage(f"Bad DMM digits {d1:02x} {d2:02x} {d3:02x} {d4:02x}")
 
 
+############################
+# handle a status line from the
+# meter reader
+def DMMStatus(words):
+    global dmm_status, dmm_heartbeat, dmm_stalled
+    if len(words) < 2:
+        return
+    if words[0] == "status":
+        if words[1] != dmm_status:
+            AddMessage("DMM " + words[1])
+        dmm_status = words[1]
+    elif words[0] == "heartbeat":
+        try:
+            gap = int(words[1])
+        except ValueError:
+            return
+        dmm_heartbeat = time.monotonic()
+        stalled = dmm_status == "connected" and gap > gDMMStallMs
+        if stalled and not dmm_stalled:
+            AddMessage("DMM connected but not sending readings")
+        dmm_stalled = stalled
+
+
+############################
+# notice if the meter reader itself
+# has stopped, as opposed to the meter
+def CheckDMMHealth():
+    global dmm_heartbeat
+    if dmm_heartbeat is not None and time.monotonic() - dmm_heartbeat > gDMMHeartbeatTimeout:
+        AddMessage("DMM reader not responding")
+        dmm_heartbeat = None
+
+
 ############################
 # check for input from the power controller
 def PcontrolRead():
@@ -554,7 +782,7 @@ def PcontrolRead():
         return
     while select.select([pcontrol], [], [], 0)[0]:
         line = pcontrol.readline().strip(" \n\r")
-        print(line)
+        Trace("pcontrol", line)
         try:
             tarray = line.split()
             if tarray[0] == "T":
@@ -562,8 +790,8 @@ def PcontrolRead():
                 temperature1 = float(tarray[2])
                 temperature2 = float(tarray[3])
                 GotTemperature(temperature1, temperature2)
-                print(
-                    f"ambient={round(ambient, 1)} temperature1={round(temperature1, 1)} temperature2={round(temperature2, 1)}")
+                log.debug("pcontrol reading", extra={"fields": {
+                    "ambient": ambient, "temperature1": temperature1, "temperature2": temperature2}})
         except Exception:
             pass
 
@@ -575,46 +803,85 @@ def Temp2Read():
         return
     while select.select([temp2], [], [], 0)[0]:
         line = temp2.readline().strip(" \n\r")
-        print(line)
+        Trace("temp2", line)
         try:
             tarray = line.split()
             ambient = float(tarray[0])
             temperature1 = float(tarray[1])
             temperature2 = float(tarray[2])
             GotTemperature(temperature1, temperature2)
-            print(
-                f"ambient={round(ambient, 1)} temperature1={round(temperature1, 1)} temperature2={round(temperature2, 1)}")
+            log.debug("temp2 reading", extra={"fields": {
+                "ambient": ambient, "temperature1": temperature1, "temperature2": temperature2}})
         except Exception:
             pass
 
 
 ############################
-# called once a second
-def tick(event):
+# take a sample, called every
+# gUpdateFrequency seconds
+def Sample():
     global CurrentTemperature
     elapsed = ElapsedTime() / 60.0
     CheckDMMInput()
     Temp2Read()
     PcontrolRead()
-    print(CurrentTemperature)
+    log.debug("temperature %.1f", CurrentTemperature)
     if CurrentTemperature != 0:
-        oldx, oldy = dmmPlot.get_data()
-        newx = np.append(oldx, elapsed)
-        newy = np.append(oldy, CurrentTemperature)
-        dmmPlot.set_data(newx, newy)
+        History.append(elapsed * 60.0, CurrentTemperature, current_power)
+        times, temps = History.series()
+        dmmPlot.set_data(times / 60.0, temps)
+        if monitor is not None:
+            monitor.publish(elapsed * 60.0, CurrentTemperature, current_power)
+        if crack_detector is not None:
+            AutoEvents(crack_detector.feed(elapsed * 60.0, CurrentTemperature, current_power))
     ui.elapsed_time.SetLabel(TimeString())
+
+
+def tick(event):
+    Sample()
+    ui.temperature_plot.draw()
+
+
+############################
+# run a virtual session flat out,
+# stepping the clock whenever the GUI
+# is idle and drawing now and then
+def VirtualTick(event):
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        if ElapsedTime() >= virtual_duration * 60.0:
+            ui.Unbind(wx.EVT_IDLE, handler=VirtualTick)
+            ui.temperature_plot.draw()
+            AddMessage("Virtual session finished")
+            bSave(None)
+            return
+        clock.advance()
+        Sample()
     ui.temperature_plot.draw()
+    event.RequestMore()
+
+
+############################
+# mark events the detector found,
+# unless they were already clicked
+def AutoEvents(names):
+    for name in names:
+        if name not in [e[1] for e in RoastEvents]:
+            bEvent(name + " (auto)")
 
 
 #############################
 # choose a reasonable default
-# file name
+# file name. Simulated sessions get their
+# own names, so they are never taken for
+# real roasts
 def ChooseDefaultFileName():
-    fname = time.strftime("%Y%m%d") + ".csv"
+    prefix = gVirtualPrefix if virtual else ""
+    fname = prefix + time.strftime("%Y%m%d") + ".csv"
     i = 1
     while os.path.exists(fname):
         i += 1
-        fname = time.strftime("%Y%m%d") + "-" + str(i) + ".csv"
+        fname = prefix + time.strftime("%Y%m%d") + "-" + str(i) + ".csv"
     ui.file_entry_box.SetValue(fname)
 
 
@@ -622,6 +889,7 @@ def ChooseDefaultFileName():
 # open a serial port for
 # power control
 def PcontrolOpen(file):
+    import serial
     s = serial.Serial(file, 9600, parity='N', rtscts=False,
                       xonxoff=False, timeout=1.0)
     time.sleep(0.2)
@@ -633,11 +901,108 @@ def PcontrolOpen(file):
 # open a serial port for
 # temp readings
 def Temp2Open(file):
+    import serial
     s = serial.Serial(file, 9600, parity='N', rtscts=False,
                       xonxoff=False, timeout=1.0)
     return s
 
 
+############################
+# start the meter reader child and
+# open the serial ports. This runs in
+# its own thread so the window comes
+# up without waiting on devices
+def OpenDevices():
+    if not nodmm:
+        try:
+            wx.CallAfter(DeviceOpened, "dmm", subprocess.Popen(rmr, stdout=subprocess.PIPE))
+        except OSError as e:
+            wx.CallAfter(AddMessage, f"failed to start {rmr}: {e}")
+
+    if pcontrol_dev:
+        wx.CallAfter(AddMessage, "opening power control " + str(pcontrol_dev))
+        try:
+            wx.CallAfter(DeviceOpened, "pcontrol", PcontrolOpen(pcontrol_dev))
+        except Exception as e:
+            wx.CallAfter(AddMessage, f"failed to open power control: {e}")
+
+    if temp2_dev:
+        wx.CallAfter(AddMessage, "opening pauls temperature contraption " + str(temp2_dev))
+        try:
+            wx.CallAfter(DeviceOpened, "temp2", Temp2Open(temp2_dev))
+        except Exception as e:
+            wx.CallAfter(AddMessage, f"failed to open temp2: {e}")
+
+
+############################
+# hand an opened device over
+# to the GUI thread
+def DeviceOpened(name, dev):
+    global dmm, dmm_file, pcontrol, temp2
+    if name == "dmm":
+        dmm = dev
+        dmm_file = dev.stdout
+    elif name == "pcontrol":
+        pcontrol = dev
+    elif name == "temp2":
+        temp2 = dev
+    StartupMark("open " + name)
+    StartupReport()
+
+
+#############################
+# print where startup time went
+# if --import-profile was given
+def StartupReport():
+    if not import_profile:
+        del startup_marks[:]
+        return
+    for label, t in startup_marks:
+        sys.stderr.write(f"startup: {(t - startup_time) * 1000:8.1f} ms  {label}\n")
+    del startup_marks[:]
+
+
+############################
+# the rest of startup, run once
+# the frame is already on screen
+def FinishStartup():
+    global crack_detector, History
+    StartupMark("first frame")
+
+    SetupPlot(ui.create_plot())
+    StartupMark("create plot")
+
+    from retention import TieredHistory
+    History = TieredHistory(window=history_window * 60.0, memory_cap=int(history_memory * (1 << 20)))
+
+    # connect up the buttons
+    ui.Bind(wx.EVT_BUTTON, bSave, ui.save_btn)
+    ui.Bind(wx.EVT_BUTTON, bSaveAs, ui.save_as_btn)
+    ui.Bind(wx.EVT_BUTTON, bReset, ui.reset_btn)
+    ui.Bind(wx.EVT_BUTTON, bLoadProfile, ui.load_profile_btn)
+    ui.Bind(wx.EVT_BUTTON, bFirstCrack, ui.first_crack_btn)
+    ui.Bind(wx.EVT_BUTTON, bRollingFirstCrack, ui.rolling_first_crack_btn)
+    ui.Bind(wx.EVT_BUTTON, bSecondCrack, ui.second_crack_btn)
+    ui.Bind(wx.EVT_BUTTON, bRollingSecondCrack, ui.rolling_second_crack_btn)
+    ui.Bind(wx.EVT_BUTTON, bUnload, ui.unload_btn)
+
+    if autodetect:
+        from crackdetect import CrackDetector
+        crack_detector = CrackDetector(GetThermalModel())
+
+    ui.load_logo()
+    if profile_file:
+        LoadProfile(profile_file)
+    ui.temperature_plot.draw()
+    StartupMark("load logo and profile")
+
+    if virtual:
+        ui.Bind(wx.EVT_IDLE, VirtualTick)
+    else:
+        ctimer.Start(milliseconds=int((1000 * gUpdateFrequency) / time_speedup))
+    StartupReport()
+
+
 #############################
 def usage():
     print(
@@ -652,6 +1017,27 @@ Options:
   --temp2 FILE         get 2nd temperature sources from FILE
   --nodmm	       don't try to read digital multimeter
   --smooth N	       smooth temperature over N values
+  --roaster NAME       use the thermal model fitted by thermalfit.py for NAME
+  --models FILE        where --roaster models are kept (default thermal_models.json)
+  --mpc                use model predictive power control
+  --mpc-horizon SEC    how far ahead --mpc looks (default 60)
+  --feedforward        compile a power schedule from the profile when it is
+                       loaded, and only correct for errors in it live
+  --ff-gain N          --feedforward correction in % per degree (default 1)
+  --speedup N          run the clock N times faster than real time
+  --virtual            simulate a whole session as fast as possible, on a
+                       clock that only moves when stepped, then save it
+                       as virtual-YYYYMMDD.csv unless given another name
+  --duration MIN       how long a --virtual session runs (default --maxtime)
+  --window MIN         keep every sample for the last MIN minutes, and roll older
+                       ones up into 1s/10s/1min min/max/mean (default --maxtime)
+  --memory-cap MB      memory for the sample history (default 4)
+  --autodetect         mark first crack and unload automatically
+  --monitor PORT       serve a live view of the roast on localhost:PORT
+  --logfile FILE       write JSON-lines log to FILE instead of stderr
+  --trace SRC[,SRC]    log raw input lines from dmm, pcontrol and/or temp2
+  --import-profile     report where startup time goes (use python -X importtime
+                       for a per-module breakdown)
 """
     )
 
@@ -669,14 +1055,15 @@ class PyCoffee(wx.App):
 # main program
 # TODO work with Tridge about integrating second temperature read.
 if __name__ == "__main__":
-    import sys
-
     try:
         opts, args = getopt.getopt(sys.argv[1:], "h",
                                    ["help", "smooth=", "pcontrol=",
                                     "profile=", "simulate", "verbose",
                                     "speedup=", "maxtemp=", "maxtime=",
-                                    "temp2=", "nodmm"])
+                                    "temp2=", "nodmm", "logfile=", "trace=",
+                                    "import-profile", "mpc", "mpc-horizon=", "feedforward", "ff-gain=",
+                                    "roaster=", "models=", "monitor=", "autodetect", "virtual",
+                                    "duration=", "window=", "memory-cap="])
     except getopt.GetoptError as err:
         print(str(err))
         usage()
@@ -708,31 +1095,75 @@ if __name__ == "__main__":
             temp2_dev = a
         elif o == "--nodmm":
             nodmm = True
+        elif o == "--logfile":
+            log_file = a
+        elif o == "--trace":
+            trace_sources = [src for src in a.split(",") if src]
+        elif o == "--import-profile":
+            import_profile = True
+        elif o == "--mpc":
+            control_mode = "mpc"
+        elif o == "--mpc-horizon":
+            mpc_horizon = float(a)
+        elif o == "--feedforward":
+            control_mode = "feedforward"
+        elif o == "--ff-gain":
+            ff_gain = float(a)
+        elif o == "--roaster":
+            roaster_name = a
+        elif o == "--models":
+            models_file = a
+        elif o == "--monitor":
+            monitor_port = int(a)
+        elif o == "--autodetect":
+            autodetect = True
+        elif o == "--virtual":
+            virtual = True
+            simulate_temp = True
+            nodmm = True
+        elif o == "--duration":
+            virtual_duration = float(a)
+        elif o == "--window":
+            history_window = float(a)
+        elif o == "--memory-cap":
+            history_memory = float(a)
         else:
             assert False, "unhandled option"
 
-    PC = PyCoffee()
-    ui = PC.program_frame
+    if virtual:
+        clock = VirtualClock(gUpdateFrequency)
+        if virtual_duration is None:
+            virtual_duration = gMaxTime
+    else:
+        clock = MonotonicClock(time_speedup)
+    if history_window is None:
+        history_window = gMaxTime
 
-    # create plot of multimeter
+    # a bad --roaster should stop us now,
+    # not fail on every sample
+    if roaster_name:
+        try:
+            GetThermalModel()
+        except (OSError, KeyError, ValueError) as err:
+            reason = err.args[0] if isinstance(err, KeyError) else err
+            print(f"Unable to load thermal model for {roaster_name}: {reason}")
+            sys.exit(2)
 
-    SetupPlot(ui.temperature_plot)
+    SetupLogging(log_file, logging.DEBUG if verbose else logging.INFO, trace_sources,
+                 clock=clock, wall_time=not virtual)
 
-    # connect up the buttons
+    PC = PyCoffee()
+    ui = PC.program_frame
+    StartupMark("create frame")
+
+    # the rest of the buttons need the
+    # plot, so are connected up later
     ui.Bind(wx.EVT_BUTTON, bQuit, ui.quit_btn)
-    ui.Bind(wx.EVT_BUTTON, bSave, ui.save_btn)
-    ui.Bind(wx.EVT_BUTTON, bSaveAs, ui.save_as_btn)
-    ui.Bind(wx.EVT_BUTTON, bReset, ui.reset_btn)
-    ui.Bind(wx.EVT_BUTTON, bLoadProfile, ui.load_profile_btn)
-    ui.Bind(wx.EVT_BUTTON, bFirstCrack, ui.first_crack_btn)
-    ui.Bind(wx.EVT_BUTTON, bRollingFirstCrack, ui.rolling_first_crack_btn)
-    ui.Bind(wx.EVT_BUTTON, bSecondCrack, ui.second_crack_btn)
-    ui.Bind(wx.EVT_BUTTON, bRollingSecondCrack, ui.rolling_second_crack_btn)
-    ui.Bind(wx.EVT_BUTTON, bUnload, ui.unload_btn)
 
-    # get the current time
-    StartTime = time.time()
+    # start the clock
+    clock.reset()
     TemperatureArray = []
+    RoastEvents = []
     CurrentTemperature = 0.0
     MaxTemperature = 0.0
     current_power = 0
@@ -740,29 +1171,26 @@ if __name__ == "__main__":
     ui.power_slider.SetValue(current_power)
     ui.auto_power_chkbx.SetValue(True)
 
-    # start the dmm child
-    if not nodmm:
-        dmm = subprocess.Popen(rmr, stdout=subprocess.PIPE)
-        dmm_file = dmm.stdout
-
-    if pcontrol_dev:
-        AddMessage("opening power control " + str(pcontrol_dev))
-        pcontrol = PcontrolOpen(pcontrol_dev)
+    if monitor_port is not None:
+        from monitor import MonitorServer
+        monitor = MonitorServer(port=monitor_port)
+        try:
+            monitor.start()
+        except OSError as err:
+            AddMessage(f"Failed to start monitor on port {monitor_port}: {err}")
+            monitor = None
 
-    if temp2_dev:
-        AddMessage("opening pauls temperature contraption " + str(temp2_dev))
-        temp2 = Temp2Open(temp2_dev)
+    # start the dmm child and serial ports
+    threading.Thread(target=OpenDevices, name="OpenDevices", daemon=True).start()
 
     # set a default file name
     ChooseDefaultFileName()
 
-    if profile_file:
-        LoadProfile(profile_file)
-
     AddMessage("Welcome to pyRoast " + gVersion)
 
+    # the timer is started once the plot exists
     ctimer = wx.Timer(owner=ui, id=wx.ID_ANY)
     ui.Bind(wx.EVT_TIMER, tick, ctimer)
-    ctimer.Start(milliseconds=int((1000 * gUpdateFrequency) / time_speedup))
 
+    wx.CallAfter(FinishStartup)
     PC.MainLoop()
@@ -1,9 +1,9 @@
 import math
 
 import wx
-from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
-from matplotlib.figure import Figure
-import numpy as np
+
+# the figure size, in inches at 100 dpi
+gFigureSize = (8.5, 3)
 
 
 class PyCoffeeFrame(wx.Frame):
@@ -21,11 +21,13 @@ class PyCoffeeFrame(wx.Frame):
         self.SetTitle("PyCoffee - The Ferg edit")
 
     def _element_setup(self):
-        self.figure = Figure((8.5, 3))
-        self.canvas = FigureCanvas(self, wx.ID_ANY, self.figure)
-        self.temperature_plot = LiveCoffeeGraph(self.canvas)
+        # matplotlib is slow to import, so the plot starts out as an
+        # empty panel and is swapped in later by create_plot()
+        self.figure = None
+        self.temperature_plot = None
+        self.canvas = wx.Panel(self, wx.ID_ANY, size=(int(gFigureSize[0] * 100), int(gFigureSize[1] * 100)))
 
-        self.coffee_img = wx.StaticBitmap(self, wx.ID_ANY, wx.Bitmap("./cslogo.png", wx.BITMAP_TYPE_ANY))
+        self.coffee_img = wx.StaticBitmap(self, wx.ID_ANY, wx.NullBitmap, size=(220, 220))
         self.temp_readout = wx.TextCtrl(self, id=wx.ID_ANY, value='', size=(220, 220), style=wx.VSCROLL | wx.TE_MULTILINE | wx.EXPAND)
 
         self.temperature_label = wx.StaticText(self, wx.ID_ANY, "Temperature:", style=wx.ALIGN_LEFT)
@@ -59,7 +61,7 @@ class PyCoffeeFrame(wx.Frame):
 
     def _do_layout(self):
         whole_win = wx.FlexGridSizer(rows=2, cols=1, hgap=0, vgap=0)
-        graph_panel = wx.FlexGridSizer(rows=1, cols=1, hgap=0, vgap=0)
+        self.graph_panel = graph_panel = wx.FlexGridSizer(rows=1, cols=1, hgap=0, vgap=0)
         options_panel = wx.FlexGridSizer(rows=1, cols=2, hgap=5, vgap=0)
         lower_left_panel = wx.FlexGridSizer(rows=5, cols=1, hgap=0, vgap=0)
         lower_right_panel = wx.FlexGridSizer(rows=1, cols=2, hgap=0, vgap=0)
@@ -118,6 +120,23 @@ class PyCoffeeFrame(wx.Frame):
 
         self.SetSizer(whole_win)
 
+    def create_plot(self):
+        from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
+        from matplotlib.figure import Figure
+
+        placeholder = self.canvas
+        self.figure = Figure(gFigureSize)
+        self.canvas = FigureCanvas(self, wx.ID_ANY, self.figure)
+        self.graph_panel.Replace(placeholder, self.canvas)
+        placeholder.Destroy()
+        self.temperature_plot = LiveCoffeeGraph(self.canvas)
+        self.Layout()
+        return self.temperature_plot
+
+    def load_logo(self, filename="./cslogo.png"):
+        self.coffee_img.SetBitmap(wx.Bitmap(filename, wx.BITMAP_TYPE_ANY))
+        self.Layout()
+
 class LiveCoffeeGraph():
     def __init__(self, parent):
         self.axes = parent.figure.add_subplot(111)
@@ -130,6 +149,7 @@ class LiveCoffeeGraph():
         self.axes.plot(elapsed, CurrentTemperature, label=label, color=color)
 
     def test_draw(self):
+        import numpy as np
         t = list(np.arange(0, 30, 0.1))
         s = np.sin(t)*100+150
         self.axes.plot(t, s)
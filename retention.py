@@ -0,0 +1,175 @@
+###################################
+# pyRoast - bounded sample history
+# Released under GNU GPLv3 or later
+#
+# the most recent samples are kept as they
+# are. Older ones are rolled up into buckets
+# of increasing width (1 s, 10 s, 1 min by
+# default) holding min/max/mean, and the
+# oldest buckets of the widest tier are
+# dropped. Every level is a fixed size ring,
+# so memory use is set when it is created.
+
+import numpy as np
+
+# the channels kept for each sample
+gChannels = ("temp", "power")
+
+_SampleType = np.dtype([("t", "f8")] + [(c, "f8") for c in gChannels])
+_BucketType = np.dtype([("n", "f8"), ("t", "f8")] +
+                       [(c + suffix, "f8") for c in gChannels for suffix in ("_min", "_max", "_sum")])
+
+
+############################
+# a fixed size ring of records,
+# oldest first
+class _Ring:
+
+    def __init__(self, dtype, capacity):
+        self.data = np.zeros(max(capacity, 1), dtype=dtype)
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def full(self):
+        return self.count == len(self.data)
+
+    def push(self, record):
+        self.data[(self.head + self.count) % len(self.data)] = record
+        self.count += 1
+
+    def oldest(self):
+        return self.data[self.head]
+
+    def pop(self):
+        record = self.data[self.head].copy()
+        self.head = (self.head + 1) % len(self.data)
+        self.count -= 1
+        return record
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def view(self):
+        end = self.head + self.count
+        if end <= len(self.data):
+            return self.data[self.head:end]
+        return np.concatenate((self.data[self.head:], self.data[:end - len(self.data)]))
+
+
+############################
+# one level of buckets, each width
+# seconds wide, plus the one filling
+class _Tier:
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.ring = _Ring(_BucketType, capacity)
+        self.open = None
+        self.index = None
+
+    def add(self, bucket, t):
+        # returns the bucket this pushes out
+        # of the ring, if any
+        index = int(t // self.width)
+        if self.open is not None and index == self.index:
+            o = self.open
+            o["n"] += bucket["n"]
+            o["t"] += bucket["t"]
+            for c in gChannels:
+                o[c + "_min"] = min(o[c + "_min"], bucket[c + "_min"])
+                o[c + "_max"] = max(o[c + "_max"], bucket[c + "_max"])
+                o[c + "_sum"] += bucket[c + "_sum"]
+            return None
+        evicted = None
+        if self.open is not None:
+            if self.ring.full():
+                evicted = self.ring.pop()
+            self.ring.push(self.open)
+        self.open = np.array(bucket, dtype=_BucketType)
+        self.index = index
+        return evicted
+
+    def buckets(self):
+        if self.open is None:
+            return self.ring.view()
+        return np.concatenate((self.ring.view(), self.open.reshape(1)))
+
+    def clear(self):
+        self.ring.clear()
+        self.open = None
+        self.index = None
+
+
+class TieredHistory:
+
+    def __init__(self, window=1800.0, tiers=(1.0, 10.0, 60.0), memory_cap=4 << 20):
+        # half the memory for raw samples,
+        # the rest shared between the tiers
+        self.window = window
+        self.samples = _Ring(_SampleType, memory_cap // 2 // _SampleType.itemsize)
+        share = memory_cap // 2 // max(len(tiers), 1) // _BucketType.itemsize
+        self.tiers = [_Tier(width, share) for width in tiers]
+
+    def nbytes(self):
+        return self.samples.data.nbytes + sum(tier.ring.data.nbytes for tier in self.tiers)
+
+    def clear(self):
+        self.samples.clear()
+        for tier in self.tiers:
+            tier.clear()
+
+    ############################
+    # add a sample, rolling anything older
+    # than the window into the tiers
+    def append(self, t, temp, power):
+        self.samples.push((t, temp, power))
+        while len(self.samples) and (self.samples.full() or t - self.samples.oldest()["t"] > self.window):
+            self._roll(self.samples.pop())
+
+    def _roll(self, sample):
+        if not self.tiers:
+            return
+        bucket = [1.0, sample["t"]]
+        for c in gChannels:
+            bucket += [sample[c], sample[c], sample[c]]
+        bucket = np.array(tuple(bucket), dtype=_BucketType)
+        t = sample["t"]
+        for tier in self.tiers:
+            bucket = tier.add(bucket, t)
+            if bucket is None:
+                return
+            t = bucket["t"] / bucket["n"]
+
+    ############################
+    # the raw samples still kept
+    def recent(self):
+        return self.samples.view()
+
+    ############################
+    # everything that has been rolled up,
+    # oldest first, as arrays of
+    # t, n and <channel>_min/_max/_mean
+    def history(self):
+        buckets = np.concatenate([tier.buckets() for tier in reversed(self.tiers)] +
+                                 [np.zeros(0, dtype=_BucketType)])
+        n = buckets["n"]
+        out = {"t": buckets["t"] / np.where(n > 0, n, 1), "n": n}
+        for c in gChannels:
+            out[c + "_min"] = buckets[c + "_min"]
+            out[c + "_max"] = buckets[c + "_max"]
+            out[c + "_mean"] = buckets[c + "_sum"] / np.where(n > 0, n, 1)
+        return out
+
+    ############################
+    # times and values of one channel
+    # over the whole session, using the
+    # mean of each rolled up bucket
+    def series(self, channel="temp"):
+        old = self.history()
+        new = self.recent()
+        return (np.concatenate((old["t"], new["t"])),
+                np.concatenate((old[channel + "_mean"], new[channel])))
@@ -0,0 +1,48 @@
+###################################
+# pyRoast - session clocks
+# Released under GNU GPLv3 or later
+#
+# everything that needs to know how far into
+# the roast we are asks the session clock.
+# The real one runs off the monotonic clock,
+# so it never jumps with the wall clock. The
+# virtual one only moves when stepped, so a
+# simulated session can run flat out and
+# come out the same every time.
+
+import time
+
+
+class MonotonicClock:
+
+    def __init__(self, speedup=1):
+        self.speedup = speedup
+        self.start = time.monotonic()
+
+    def reset(self):
+        self.start = time.monotonic()
+
+    ############################
+    # seconds since the last reset
+    def elapsed(self):
+        return self.speedup * (time.monotonic() - self.start)
+
+
+class VirtualClock:
+
+    def __init__(self, step):
+        self.step = step
+        self.ticks = 0
+
+    def reset(self):
+        self.ticks = 0
+
+    ############################
+    # move on by one step. Time is kept
+    # as a whole number of steps so it
+    # never gathers rounding error
+    def advance(self):
+        self.ticks += 1
+
+    def elapsed(self):
+        return self.ticks * self.step
@@ -0,0 +1,92 @@
+###################################
+# pyRoast - reading saved roasts
+# Released under GNU GPLv3 or later
+#
+# bSave writes Time,Temperature,Event,Power
+# with the time in seconds. Older saves
+# have no Power column. Samples rolled up
+# in long sessions are saved alongside as
+# NAME-history.csv, and roaststats.py writes
+# RoR curves as NAME-ror.csv. Neither is a
+# roast, so both are skipped when looking.
+# --virtual sessions are saved as
+# virtual-NAME.csv, and are only read
+# when named directly.
+
+import csv
+import os
+
+gHistorySuffix = "-history.csv"
+gRoRSuffix = "-ror.csv"
+gNotRoasts = (gHistorySuffix, gRoRSuffix)
+gVirtualPrefix = "virtual-"
+
+
+###########################
+# useful fn to see if a string
+# is a number
+def isNumber(s) -> bool:
+    try:
+        float(s)
+    except Exception:
+        return False
+    return True
+
+
+###########################
+# all the roast logs under the
+# given files and directories
+def FindRoasts(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if not name.endswith(".csv") or name.endswith(gNotRoasts):
+                        continue
+                    if name.startswith(gVirtualPrefix):
+                        continue
+                    yield os.path.join(root, name)
+        elif not path.endswith(gNotRoasts):
+            yield path
+
+
+###########################
+# a name for a roast found by FindRoasts
+# that tells it apart from others with
+# the same file name, for naming files
+# made from it: the path below the
+# directory it was found in, or the
+# path as given otherwise
+def RoastName(filename, paths):
+    for path in paths:
+        if os.path.isdir(path):
+            rel = os.path.relpath(filename, path)
+            if rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+                return rel
+    rel = os.path.relpath(filename)
+    if rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+        return rel
+    return os.path.splitdrive(os.path.abspath(filename))[1].lstrip(os.sep)
+
+
+###########################
+# yield (time, temperature, event, power)
+# for each sample in a saved roast, one
+# line at a time. The event is "" if there
+# is none, the power None if not logged.
+def ReadRoast(filename):
+    with open(filename, newline='') as f:
+        for p in csv.reader(f):
+            if len(p) < 2:
+                continue
+            try:
+                t = float(p[0])
+                temp = float(p[1])
+            except ValueError:
+                continue
+            event = p[2] if len(p) > 2 else ""
+            if event and isNumber(event):
+                event = ""
+            power = float(p[3]) if len(p) > 3 and p[3] and isNumber(p[3]) else None
+            yield t, temp, event, power
@@ -0,0 +1,154 @@
+###################################
+# pyRoast - structured logging
+# Released under GNU GPLv3 or later
+#
+# all log output goes through a queue to a
+# background thread, so a slow terminal or log
+# collector never blocks the GUI thread
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+log = logging.getLogger("pyroast")
+
+# sources whose raw input lines are traced
+TraceSources = set()
+
+_listener = None
+
+
+############################
+# format records as compact
+# JSON, one per line
+class JsonLinesFormatter(logging.Formatter):
+
+    def __init__(self, wall_time=True):
+        logging.Formatter.__init__(self)
+        self.wall_time = wall_time
+
+    def format(self, record):
+        entry = {}
+        if self.wall_time:
+            entry["t"] = round(record.created, 3)
+        session_time = getattr(record, "session_time", None)
+        if session_time is not None:
+            entry["st"] = round(session_time, 3)
+        entry["lvl"] = record.levelname
+        entry["src"] = record.name
+        entry["msg"] = record.getMessage()
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"))
+
+
+############################
+# drop repeats of the same message
+# within interval seconds, and report
+# how many were dropped on the next one
+class RateLimitFilter(logging.Filter):
+
+    def __init__(self, interval=5.0):
+        logging.Filter.__init__(self)
+        self.interval = interval
+        self.seen = {}
+
+    def filter(self, record):
+        if record.name.startswith("pyroast.trace"):
+            return True
+        key = (record.name, record.msg)
+        now = getattr(record, "session_time", None)
+        if now is None:
+            now = record.created
+        last, suppressed = self.seen.get(key, (None, 0))
+        if last is not None and now < last:
+            # the session clock has been reset,
+            # so start counting afresh
+            self.seen.clear()
+            last, suppressed = None, 0
+        if last is not None and now - last < self.interval:
+            self.seen[key] = (last, suppressed + 1)
+            return False
+        if suppressed:
+            fields = dict(getattr(record, "fields", None) or {})
+            fields["suppressed"] = suppressed
+            record.fields = fields
+        self.seen[key] = (now, 0)
+        return True
+
+
+############################
+# stamp records with the session
+# clock as they are made
+class SessionTimeFilter(logging.Filter):
+
+    def __init__(self, clock):
+        logging.Filter.__init__(self)
+        self.clock = clock
+
+    def filter(self, record):
+        record.session_time = self.clock.elapsed()
+        return True
+
+
+############################
+# queue handler that leaves all
+# formatting to the listener thread
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        return record
+
+
+############################
+# start the background log writer
+def SetupLogging(filename=None, level=logging.INFO, trace=(), rate_limit=5.0, clock=None, wall_time=True):
+    global _listener
+    if filename:
+        handler = logging.FileHandler(filename)
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonLinesFormatter(wall_time))
+
+    q = queue.SimpleQueue()
+    qhandler = _DeferredQueueHandler(q)
+    if clock is not None:
+        qhandler.addFilter(SessionTimeFilter(clock))
+    qhandler.addFilter(RateLimitFilter(rate_limit))
+    log.handlers = [qhandler]
+    log.setLevel(level)
+    log.propagate = False
+
+    TraceSources.clear()
+    for source in trace:
+        TraceSources.add(source)
+        logging.getLogger("pyroast.trace." + source).setLevel(logging.DEBUG)
+
+    _listener = logging.handlers.QueueListener(q, handler)
+    _listener.start()
+    # the listener thread is a daemon, so flush
+    # however the program ends
+    atexit.register(ShutdownLogging)
+
+
+############################
+# flush and stop the log writer
+def ShutdownLogging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+############################
+# trace a raw input line, if
+# tracing is on for that source
+def Trace(source, line):
+    if source in TraceSources:
+        logging.getLogger("pyroast.trace." + source).debug("%s", line)
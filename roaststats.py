@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+###################################
+# pyRoast - summarise archived roasts
+# Released under GNU GPLv3 or later
+#
+# each roast is read a line at a time in
+# a pool of worker processes, and one row
+# of metrics per roast is written out
+
+import bisect
+import collections
+import csv
+import getopt
+import multiprocessing
+import os
+import sys
+import time
+
+from roastcsv import FindRoasts, ReadRoast, RoastName, gRoRSuffix
+
+# the events pyRoast's buttons record
+gEvents = ["First crack", "Rolling first crack", "Second crack", "Rolling second crack", "Unload"]
+# and their columns, FirstCrack and so on
+gEventColumns = {e: "".join(w.capitalize() for w in e.split()) for e in gEvents}
+
+# the rate of change is measured over this many seconds
+gRoRWindow = 30.0
+# and sampled this often for the RoR curves
+gRoRInterval = 10.0
+
+gColumns = ["File", "Samples", "Duration", "MaxTemperature", "MaxRoR", "MeanRoR"] + \
+           [gEventColumns[e] for e in gEvents] + \
+           ["RoRAtFirstCrack", "TimeToFirstCrack", "FirstToSecondCrack", "DevelopmentTime", "DevelopmentRatio",
+            "ProfileRMSError", "ProfileMaxError"]
+
+# per worker settings, set by WorkerInit
+profile = None
+ror_dir = None
+roots = []
+
+
+###########################
+# load a profile as sorted
+# (times, temperatures) lists
+def LoadProfile(filename):
+    times = []
+    temps = []
+    for t, temp, event, power in ReadRoast(filename):
+        times.append(t)
+        temps.append(temp)
+    return times, temps
+
+
+###########################
+# profile temperature at time t,
+# or None outside the profile
+def ProfileAt(t):
+    times, temps = profile
+    i = bisect.bisect_left(times, t)
+    if i < len(times) and times[i] == t:
+        return temps[i]
+    if i == 0 or i == len(times):
+        return None
+    t0, t1 = times[i - 1], times[i]
+    return temps[i - 1] + (temps[i] - temps[i - 1]) * (t - t0) / (t1 - t0)
+
+
+def WorkerInit(profile_file, ror_directory, paths):
+    global profile, ror_dir, roots
+    if profile_file:
+        profile = LoadProfile(profile_file)
+    ror_dir = ror_directory
+    roots = paths
+
+
+###########################
+# metrics for one roast, as
+# a row for the summary table
+def AnalyseRoast(filename):
+    window = collections.deque()
+    events = {}
+    ror_curve = []
+    samples = 0
+    start = None
+    t = 0.0
+    max_temp = 0.0
+    max_ror = None
+    ror_sum = 0.0
+    ror_count = 0
+    ror = None
+    next_ror_sample = 0.0
+    err_sq = 0.0
+    err_max = 0.0
+    err_count = 0
+
+    try:
+        for t, temp, event, power in ReadRoast(filename):
+            if start is None:
+                start = t
+            samples += 1
+            if temp > max_temp:
+                max_temp = temp
+
+            window.append((t, temp))
+            while t - window[0][0] > gRoRWindow:
+                window.popleft()
+            span = t - window[0][0]
+            if span >= gRoRWindow / 2:
+                ror = (temp - window[0][1]) * 60.0 / span
+                ror_sum += ror
+                ror_count += 1
+                if max_ror is None or ror > max_ror:
+                    max_ror = ror
+                if t - start >= next_ror_sample:
+                    ror_curve.append((t - start, ror))
+                    next_ror_sample += gRoRInterval
+
+            if event and event not in events:
+                events[event] = (t - start, ror)
+
+            if profile is not None:
+                target = ProfileAt(t - start)
+                if target is not None:
+                    err = temp - target
+                    err_sq += err * err
+                    err_count += 1
+                    if abs(err) > err_max:
+                        err_max = abs(err)
+    except OSError as e:
+        sys.stderr.write(f"{filename}: {e}\n")
+        return None
+    if start is None:
+        return None
+
+    # events the detector found only
+    # count if nobody clicked the button
+    for name in gEvents:
+        if name not in events and name + " (auto)" in events:
+            events[name] = events[name + " (auto)"]
+
+    duration = t - start
+    first = events.get("First crack", (None,))[0]
+    second = events.get("Second crack", (None,))[0]
+    end = events.get("Unload", (duration,))[0]
+    row = {"File": filename,
+           "Samples": samples,
+           "Duration": duration,
+           "MaxTemperature": max_temp,
+           "MaxRoR": max_ror,
+           "MeanRoR": ror_sum / ror_count if ror_count else None,
+           "RoRAtFirstCrack": events.get("First crack", (None, None))[1],
+           "TimeToFirstCrack": first,
+           "FirstToSecondCrack": second - first if first is not None and second is not None else None,
+           "DevelopmentTime": end - first if first is not None else None,
+           "DevelopmentRatio": (end - first) / end if first is not None and end > 0 else None,
+           "ProfileRMSError": (err_sq / err_count) ** 0.5 if err_count else None,
+           "ProfileMaxError": err_max if err_count else None}
+    for e in gEvents:
+        row[gEventColumns[e]] = events.get(e, (None,))[0]
+
+    if ror_dir is not None:
+        # keep the layout of the archive, as pyRoast
+        # gives roasts on every machine the same names
+        name = os.path.join(ror_dir, os.path.splitext(RoastName(filename, roots))[0] + gRoRSuffix)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with open(name, "w") as f:
+            f.write("Time,RoR\n")
+            for p in ror_curve:
+                f.write(f"{p[0]:.1f},{p[1]:.2f}\n")
+    return row
+
+
+#############################
+def usage():
+    print(
+        """
+Usage: roaststats.py [options] LOG|DIR...
+Options:
+  -h                   show this help
+  --output FILE        write the summary table to FILE (default stdout)
+  --profile PROFILE    report tracking error against PROFILE
+  --ror-dir DIR        write each roast's RoR curve into DIR, as NAME-ror.csv
+                       under the same subdirectories as the roast
+  --jobs N             number of worker processes (default all CPUs)
+"""
+    )
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "output=", "profile=", "ror-dir=", "jobs="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+
+    output = None
+    profile_file = None
+    ror_directory = None
+    jobs = os.cpu_count()
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif o == "--output":
+            output = a
+        elif o == "--profile":
+            profile_file = a
+        elif o == "--ror-dir":
+            ror_directory = a
+        elif o == "--jobs":
+            jobs = int(a)
+    if not args:
+        usage()
+        sys.exit(2)
+    if ror_directory:
+        os.makedirs(ror_directory, exist_ok=True)
+
+    started = time.time()
+    files = list(FindRoasts(args))
+    with multiprocessing.Pool(jobs, initializer=WorkerInit, initargs=(profile_file, ror_directory, args)) as pool:
+        rows = [row for row in pool.imap_unordered(AnalyseRoast, files, chunksize=32) if row is not None]
+    rows.sort(key=lambda row: row["File"])
+
+    f = open(output, "w", newline='') if output else sys.stdout
+    writer = csv.DictWriter(f, fieldnames=gColumns)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({k: f"{v:.2f}" if isinstance(v, float) else v for k, v in row.items()})
+    if output:
+        f.close()
+    sys.stderr.write(f"{len(rows)} roasts in {time.time() - started:.1f}s\n")
@@ -0,0 +1,98 @@
+/*
+  the parts of libusb-1.0 that RawMeterReader uses, for building
+  it against libusb_stub.c. Not a full libusb header.
+
+  Released under GPLv3
+ */
+#ifndef LIBUSB_STUB_H
+#define LIBUSB_STUB_H
+
+#include <sys/time.h>
+
+#define LIBUSB_CALL
+
+typedef struct libusb_context libusb_context;
+typedef struct libusb_device libusb_device;
+typedef struct libusb_device_handle libusb_device_handle;
+typedef int libusb_hotplug_callback_handle;
+
+enum {
+	LIBUSB_SUCCESS = 0,
+	LIBUSB_CAP_HAS_HOTPLUG = 1,
+	LIBUSB_HOTPLUG_MATCH_ANY = -1,
+};
+
+typedef enum {
+	LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED = 1,
+	LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT = 2,
+} libusb_hotplug_event;
+
+enum libusb_transfer_status {
+	LIBUSB_TRANSFER_COMPLETED = 0,
+	LIBUSB_TRANSFER_ERROR = 1,
+	LIBUSB_TRANSFER_CANCELLED = 3,
+	LIBUSB_TRANSFER_NO_DEVICE = 5,
+};
+
+struct libusb_transfer;
+typedef void (LIBUSB_CALL *libusb_transfer_cb_fn)(struct libusb_transfer *);
+typedef int (LIBUSB_CALL *libusb_hotplug_callback_fn)(libusb_context *, libusb_device *,
+						       libusb_hotplug_event, void *);
+
+struct libusb_transfer {
+	libusb_device_handle *dev_handle;
+	unsigned char endpoint;
+	unsigned int timeout;
+	enum libusb_transfer_status status;
+	int length;
+	int actual_length;
+	libusb_transfer_cb_fn callback;
+	void *user_data;
+	unsigned char *buffer;
+};
+
+int libusb_init(libusb_context **ctx);
+void libusb_set_debug(libusb_context *ctx, int level);
+int libusb_has_capability(unsigned int capability);
+int libusb_hotplug_register_callback(libusb_context *ctx, int events, int flags,
+				     int vendor_id, int product_id, int dev_class,
+				     libusb_hotplug_callback_fn cb, void *user_data,
+				     libusb_hotplug_callback_handle *handle);
+
+libusb_device_handle *libusb_open_device_with_vid_pid(libusb_context *ctx,
+						      unsigned short vendor_id,
+						      unsigned short product_id);
+void libusb_close(libusb_device_handle *h);
+int libusb_detach_kernel_driver(libusb_device_handle *h, int interface);
+int libusb_claim_interface(libusb_device_handle *h, int interface);
+int libusb_release_interface(libusb_device_handle *h, int interface);
+int libusb_control_transfer(libusb_device_handle *h, unsigned char request_type,
+			    unsigned char request, unsigned short value,
+			    unsigned short index, unsigned char *data,
+			    unsigned short length, unsigned int timeout);
+
+struct libusb_transfer *libusb_alloc_transfer(int iso_packets);
+void libusb_free_transfer(struct libusb_transfer *t);
+int libusb_submit_transfer(struct libusb_transfer *t);
+int libusb_cancel_transfer(struct libusb_transfer *t);
+int libusb_handle_events_timeout(libusb_context *ctx, struct timeval *tv);
+int libusb_handle_events_timeout_completed(libusb_context *ctx, struct timeval *tv,
+					   int *completed);
+
+static inline void libusb_fill_interrupt_transfer(struct libusb_transfer *t,
+						  libusb_device_handle *h,
+						  unsigned char endpoint,
+						  unsigned char *buffer, int length,
+						  libusb_transfer_cb_fn callback,
+						  void *user_data, unsigned int timeout)
+{
+	t->dev_handle = h;
+	t->endpoint = endpoint;
+	t->buffer = buffer;
+	t->length = length;
+	t->callback = callback;
+	t->user_data = user_data;
+	t->timeout = timeout;
+}
+
+#endif
@@ -0,0 +1,216 @@
+/*
+  a stub libusb that plays a meter to RawMeterReader, for
+  "make test-reader"
+
+  the meter sends a few readings, then glitches and is away for
+  SHORT_GONE_MS. A few readings later it goes away again for
+  LONG_GONE_MS, and once back waits HOLD_MS before sending. The
+  program exits after TOTAL_READINGS. Timing, and how often the
+  reader looked for the meter while it was away, go to stderr as
+  "stub: ..." lines for test_reader.sh to check. With STUB_HOTPLUG
+  set in the environment the stub reports hotplug support and sends
+  arrive/leave events, otherwise the reader has to poll.
+
+  Released under GPLv3
+ */
+#include <libusb-1.0/libusb.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+
+#define SHORT_GLITCH	3
+#define SHORT_GONE_MS	300
+#define LONG_GLITCH	6
+#define LONG_GONE_MS	3000
+#define TOTAL_READINGS	10
+#define HOLD_MS		1200
+#define READING_MS	5
+
+static struct libusb_transfer *pending;
+static int cancelled;
+static int readings;
+static long long gone_until = -1;
+static int reopened;
+static int attempts;
+static long long next_reading;
+static libusb_hotplug_callback_fn hotplug_cb;
+static int arrival_sent;
+
+static long long now_ms(void)
+{
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (long long)ts.tv_sec * 1000 + ts.tv_nsec / 1000000;
+}
+
+static int present(void)
+{
+	return gone_until < 0 || now_ms() >= gone_until;
+}
+
+int libusb_init(libusb_context **ctx)
+{
+	*ctx = (libusb_context *)1;
+	return 0;
+}
+
+void libusb_set_debug(libusb_context *ctx, int level)
+{
+}
+
+int libusb_has_capability(unsigned int capability)
+{
+	return capability == LIBUSB_CAP_HAS_HOTPLUG && getenv("STUB_HOTPLUG") != NULL;
+}
+
+int libusb_hotplug_register_callback(libusb_context *ctx, int events, int flags,
+				     int vendor_id, int product_id, int dev_class,
+				     libusb_hotplug_callback_fn cb, void *user_data,
+				     libusb_hotplug_callback_handle *handle)
+{
+	hotplug_cb = cb;
+	return LIBUSB_SUCCESS;
+}
+
+libusb_device_handle *libusb_open_device_with_vid_pid(libusb_context *ctx,
+						      unsigned short vendor_id,
+						      unsigned short product_id)
+{
+	if (!present()) {
+		attempts++;
+		return NULL;
+	}
+	if (gone_until >= 0 && !reopened) {
+		fprintf(stderr, "stub: reopened %lld ms after the meter came back\n",
+			now_ms() - gone_until);
+		fprintf(stderr, "stub: %d attempts to open while away\n", attempts);
+		reopened = 1;
+		if (readings >= LONG_GLITCH) {
+			next_reading = now_ms() + HOLD_MS;
+		}
+	}
+	return (libusb_device_handle *)1;
+}
+
+void libusb_close(libusb_device_handle *h)
+{
+}
+
+int libusb_detach_kernel_driver(libusb_device_handle *h, int interface)
+{
+	return 0;
+}
+
+int libusb_claim_interface(libusb_device_handle *h, int interface)
+{
+	return 0;
+}
+
+int libusb_release_interface(libusb_device_handle *h, int interface)
+{
+	return 0;
+}
+
+int libusb_control_transfer(libusb_device_handle *h, unsigned char request_type,
+			    unsigned char request, unsigned short value,
+			    unsigned short index, unsigned char *data,
+			    unsigned short length, unsigned int timeout)
+{
+	if (request_type == 0x81) {
+		return 19;
+	}
+	return length;
+}
+
+struct libusb_transfer *libusb_alloc_transfer(int iso_packets)
+{
+	return calloc(1, sizeof(struct libusb_transfer));
+}
+
+void libusb_free_transfer(struct libusb_transfer *t)
+{
+	free(t);
+}
+
+int libusb_submit_transfer(struct libusb_transfer *t)
+{
+	if (!present()) {
+		return -1;
+	}
+	pending = t;
+	cancelled = 0;
+	return 0;
+}
+
+int libusb_cancel_transfer(struct libusb_transfer *t)
+{
+	if (pending != t) {
+		return -1;
+	}
+	cancelled = 1;
+	return 0;
+}
+
+static void complete(enum libusb_transfer_status status, int length)
+{
+	struct libusb_transfer *t = pending;
+	pending = NULL;
+	t->status = status;
+	t->actual_length = length;
+	t->callback(t);
+}
+
+int libusb_handle_events_timeout(libusb_context *ctx, struct timeval *tv)
+{
+	return libusb_handle_events_timeout_completed(ctx, tv, NULL);
+}
+
+int libusb_handle_events_timeout_completed(libusb_context *ctx, struct timeval *tv,
+					   int *completed)
+{
+	long long now;
+
+	usleep(1000);
+	now = now_ms();
+
+	if (gone_until >= 0 && now >= gone_until && !arrival_sent) {
+		arrival_sent = 1;
+		if (hotplug_cb != NULL) {
+			hotplug_cb(ctx, NULL, LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED, NULL);
+		}
+	}
+
+	if (pending == NULL) {
+		return 0;
+	}
+	if (cancelled) {
+		complete(LIBUSB_TRANSFER_CANCELLED, 0);
+		return 0;
+	}
+	if (now < next_reading) {
+		return 0;
+	}
+
+	readings++;
+	if (readings == SHORT_GLITCH || readings == LONG_GLITCH) {
+		fprintf(stderr, "stub: meter gone\n");
+		gone_until = now + (readings == SHORT_GLITCH ? SHORT_GONE_MS : LONG_GONE_MS);
+		reopened = 0;
+		arrival_sent = 0;
+		attempts = 0;
+		if (hotplug_cb != NULL) {
+			hotplug_cb(ctx, NULL, LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT, NULL);
+		}
+		complete(LIBUSB_TRANSFER_NO_DEVICE, 0);
+		return 0;
+	}
+	if (readings > TOTAL_READINGS) {
+		exit(0);
+	}
+	memset(pending->buffer, readings, pending->length);
+	next_reading = now + READING_MS;
+	complete(LIBUSB_TRANSFER_COMPLETED, pending->length);
+	return 0;
+}
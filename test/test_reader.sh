@@ -0,0 +1,47 @@
+#!/bin/sh
+# run RawMeterReader built against libusb_stub.c and check
+# what it prints, with and without hotplug support
+
+reader=${1:-test/RawMeterReader-stub}
+out=$(mktemp)
+err=$(mktemp)
+trap 'rm -f $out $err' EXIT
+
+fail() {
+	echo "FAIL ($mode): $*"
+	cat $out $err
+	exit 1
+}
+
+for mode in polling hotplug; do
+	if [ $mode = hotplug ]; then
+		STUB_HOTPLUG=1 $reader >$out 2>$err
+	else
+		$reader >$out 2>$err
+	fi || fail "reader exited with an error"
+
+	[ "$(head -n 1 $out)" = "# status disconnected" ] || fail "first line is not disconnected status"
+	[ $(grep -c '^# status connected$' $out) -eq 3 ] || fail "expected to connect three times"
+	[ $(grep -c '^# status disconnected$' $out) -eq 3 ] || fail "expected to see the meter go away twice"
+	[ $(grep -c '^00 \([0-9A-F][0-9A-F] \)\{14\}$' $out) -eq 8 ] || fail "expected 8 readings"
+
+	# a glitch should cost tens of milliseconds, not seconds
+	ms=$(sed -n 's/^stub: reopened \([0-9]*\) ms.*/\1/p' $err | head -n 1)
+	[ -n "$ms" ] && [ $ms -lt 100 ] || fail "reconnect took ${ms:-forever} ms"
+
+	# but a meter that stays away should only be
+	# looked for now and then: 3 s away is at most
+	# a second of fast polling and a few slow tries
+	tries=$(sed -n 's/^stub: \([0-9]*\) attempts to open.*/\1/p' $err | tail -n 1)
+	[ -n "$tries" ] && [ $tries -lt 60 ] || fail "looked for the meter ${tries:-?} times in 3 s"
+
+	# the time the meter was away must not count
+	# against it once it is connected again
+	gaps=$(awk '/^# status connected$/ { n++ } n == 3 && $2 == "heartbeat" { print $3 }' $out)
+	[ -n "$gaps" ] || fail "no heartbeat after reconnecting"
+	for gap in $gaps; do
+		[ $gap -lt 1500 ] || fail "heartbeat of $gap ms counts the time it was away"
+	done
+
+	echo "ok ($mode): reconnected in $ms ms, $tries tries while away"
+done
@@ -0,0 +1,111 @@
+###################################
+# pyRoast - roaster thermal model
+# Released under GNU GPLv3 or later
+#
+# the heat gun warms the first of a chain
+# of cells, and each cell then moves half
+# way towards the one before it. The
+# thermocouple reads the last cell.
+
+import json
+import os
+
+import numpy as np
+
+
+class ThermalModel:
+
+    def __init__(self, r=0.0085, k=0.0040, num_cells=40, base_temp=29.0, step=0.5):
+        self.r = r
+        self.k = k
+        self.num_cells = num_cells
+        self.base_temp = base_temp
+        # the CS DMM gives a value every 0.5 seconds
+        self.step = step
+        self.chain = ChainMatrix(num_cells)
+
+    def __repr__(self):
+        return (f"ThermalModel(r={self.r!r}, k={self.k!r}, num_cells={self.num_cells!r}, "
+                f"base_temp={self.base_temp!r}, step={self.step!r})")
+
+    ############################
+    # rate of change of the first
+    # cell, in degrees per second
+    def delta_t(self, T, P, Tbase=None):
+        if Tbase is None:
+            Tbase = self.base_temp
+        return self.r * P - self.k * (T - Tbase)
+
+    ############################
+    # all cells at one temperature,
+    # the base temperature by default
+    def initial_state(self, temp=None):
+        if temp is None:
+            temp = self.base_temp
+        return np.full(self.num_cells, float(temp))
+
+    ############################
+    # advance the cells by dt seconds
+    # at a fixed power, in place
+    def advance(self, cells, power, dt):
+        cells[..., 0] += self.delta_t(cells[..., 0], power) * dt
+        cells[...] = cells @ self.chain.T
+        return cells
+
+    ############################
+    # run a batch of power trajectories,
+    # shape (N, steps), from one starting
+    # state and return the temperature
+    # the thermocouple sees after each step
+    def rollout(self, cells, powers):
+        powers = np.atleast_2d(np.asarray(powers, dtype=float))
+        state = np.repeat(np.asarray(cells, dtype=float)[np.newaxis, :], len(powers), axis=0)
+        out = np.empty(powers.shape)
+        for i in range(powers.shape[1]):
+            self.advance(state, powers[:, i], self.step)
+            out[:, i] = state[:, -1]
+        return out
+
+
+############################
+# the chain update, where each cell
+# moves half way towards the already
+# updated cell before it, as one matrix
+def ChainMatrix(num_cells):
+    m = np.zeros((num_cells, num_cells))
+    m[0, 0] = 1.0
+    for i in range(1, num_cells):
+        m[i, :i] = 0.5 * m[i - 1, :i]
+        m[i, i] = 0.5
+    return m
+
+
+############################
+# load the model fitted for a
+# roaster by thermalfit.py
+def LoadModel(filename, name):
+    with open(filename) as f:
+        models = json.load(f)
+    if name not in models:
+        raise KeyError(f"no thermal model for roaster {name!r} in {filename}")
+    m = models[name]
+    try:
+        return ThermalModel(r=m["r"], k=m["k"], num_cells=m["num_cells"],
+                            base_temp=m["base_temp"], step=m["step"])
+    except KeyError as err:
+        raise ValueError(f"thermal model for roaster {name!r} in {filename} has no {err.args[0]}")
+
+
+############################
+# store a roaster's model, along
+# with any notes about the fit
+def SaveModel(filename, name, model, **info):
+    models = {}
+    if os.path.exists(filename):
+        with open(filename) as f:
+            models = json.load(f)
+    models[name] = dict(r=model.r, k=model.k, num_cells=model.num_cells,
+                        base_temp=model.base_temp, step=model.step, **info)
+    with open(filename + ".tmp", "w") as f:
+        json.dump(models, f, indent=2, sort_keys=True)
+    os.replace(filename + ".tmp", filename)
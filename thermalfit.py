@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+###################################
+# pyRoast - fit the thermal model to
+# saved roast logs
+# Released under GNU GPLv3 or later
+#
+# the first cell is a first order lag on the
+# power, and the rest of the chain is a fixed
+# filter on the first cell, so for a given
+# number of cells and k the logged temperature
+# is linear in r and the base temperature.
+# Every roast and every candidate k is fitted
+# at once as a batch of 2x2 least squares.
+
+import getopt
+import sys
+import time
+
+import numpy as np
+
+from roastcsv import FindRoasts, ReadRoast
+from thermal import ThermalModel, ChainMatrix, SaveModel
+
+gDefaultCells = "10,15,20,30,40,50,60,80"
+gChunk = 32
+
+
+###########################
+# read a saved roast and resample
+# it onto the model time step. The
+# power is held from each log line
+# until the next.
+def LoadRoast(filename, step):
+    t = []
+    temp = []
+    power = []
+    for sample_t, sample_temp, event, sample_power in ReadRoast(filename):
+        if sample_power is None:
+            continue
+        t.append(sample_t)
+        temp.append(sample_temp)
+        power.append(sample_power)
+    if len(t) < 2:
+        return None
+    t = np.array(t)
+    grid = t[0] + step * np.arange(1, int((t[-1] - t[0]) / step) + 1)
+    held = np.array(power)[np.searchsorted(t, grid - step, side='right') - 1]
+    return np.interp(grid, t, temp), held, temp[0]
+
+
+###########################
+# the response of the last cell to
+# a unit impulse in the first
+def ChainImpulse(num_cells, length):
+    m = ChainMatrix(num_cells)
+    cells = np.zeros(num_cells)
+    h = np.empty(length)
+    for n in range(length):
+        cells[0] = 1.0 if n == 0 else 0.0
+        cells = m @ cells
+        h[n] = cells[-1]
+    return h
+
+
+###########################
+# the smallest length of at least n
+# with no prime factors above 5, which
+# numpy's FFT handles quickly
+def FastLength(n):
+    best = 1 << int(np.ceil(np.log2(n)))
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            m = p35
+            while m < n:
+                m *= 2
+            best = min(best, m)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+###########################
+# the first cell's deviation from its
+# starting temperature for every k,
+# split into a part driven by the power
+# (times r) and a part driven by the
+# base temperature (times k). The
+# second is the same for every roast.
+def FirstCell(powers, ks, step):
+    decay = (1 - ks * step)[:, np.newaxis]
+    driven = np.zeros((len(ks),) + powers.shape)
+    base = np.zeros((len(ks), powers.shape[1]))
+    a = np.zeros((len(ks), powers.shape[0]))
+    b = np.zeros(len(ks))
+    for n in range(powers.shape[1]):
+        a = decay * a + step * powers[:, n]
+        b = decay[:, 0] * b + step
+        driven[:, :, n] = a
+        base[:, n] = b
+    return driven, base
+
+
+###########################
+# sum the normal equations for every
+# (cells, k) pair over a chunk of roasts
+def Accumulate(stats, temps, powers, init, mask, ks, cells, step):
+    length = temps.shape[1]
+    nfft = FastLength(2 * length)
+    driven, base = FirstCell(powers, ks, step)
+    fdriven = np.fft.rfft(driven, nfft)
+    fbase = np.fft.rfft(base, nfft)
+    init = init[:, np.newaxis]
+    for i, n in enumerate(cells):
+        h = np.fft.rfft(ChainImpulse(n, length), nfft)
+        u = np.fft.irfft(fdriven * h, nfft)[..., :length] * mask
+        v = np.fft.irfft(fbase * h, nfft)[:, np.newaxis, :length] * ks[:, np.newaxis, np.newaxis] * mask
+        z = (temps - init + init * v) * mask
+        stats[i] += np.stack([np.sum(x * y, axis=(1, 2))
+                              for x, y in ((u, u), (u, v), (v, v), (u, z), (v, z), (z, z))], axis=1)
+
+
+###########################
+# solve the normal equations, giving
+# r, base temperature and residual
+# sum of squares for every (cells, k)
+def Solve(stats):
+    uu, uv, vv, uz, vz, zz = np.moveaxis(stats, -1, 0)
+    det = uu * vv - uv * uv
+    det = np.where(np.abs(det) > 1e-12, det, np.nan)
+    r = (vv * uz - uv * vz) / det
+    base = (uu * vz - uv * uz) / det
+    sse = zz - 2 * (r * uz + base * vz) + r * r * uu + 2 * r * base * uv + base * base * vv
+    return r, base, np.where(np.isfinite(sse), sse, np.inf)
+
+
+###########################
+# fit one model to a set of roasts
+def FitModel(roasts, cells, ks, step):
+    length = max(len(temp) for temp, power, init in roasts)
+    stats = np.zeros((len(cells), len(ks), 6))
+    for start in range(0, len(roasts), gChunk):
+        chunk = roasts[start:start + gChunk]
+        temps = np.zeros((len(chunk), length))
+        powers = np.zeros((len(chunk), length))
+        mask = np.zeros((len(chunk), length))
+        for j, (temp, power, init) in enumerate(chunk):
+            temps[j, :len(temp)] = temp
+            powers[j, :len(power)] = power
+            mask[j, :len(temp)] = 1.0
+        init = np.array([init for temp, power, init in chunk])
+        Accumulate(stats, temps, powers, init, mask, ks, cells, step)
+    r, base, sse = Solve(stats)
+    i, j = np.unravel_index(np.argmin(sse), sse.shape)
+    return i, j, r[i, j], base[i, j], sse[i, j], stats[i, j]
+
+
+#############################
+def usage():
+    print(
+        """
+Usage: thermalfit.py [options] LOG|DIR...
+Options:
+  -h                   show this help
+  --roaster NAME       store the fitted model under NAME (required)
+  --models FILE        the model file to update (default thermal_models.json)
+  --cells N[,N]        numbers of cells to try (default %s)
+""" % gDefaultCells
+    )
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "roaster=", "models=", "cells="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+
+    roaster = None
+    models_file = "thermal_models.json"
+    cells = gDefaultCells
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit(1)
+        elif o == "--roaster":
+            roaster = a
+        elif o == "--models":
+            models_file = a
+        elif o == "--cells":
+            cells = a
+    if roaster is None or not args:
+        usage()
+        sys.exit(2)
+    cells = [int(n) for n in cells.split(",")]
+
+    started = time.time()
+    step = ThermalModel().step
+    roasts = []
+    for fname in FindRoasts(args):
+        roast = LoadRoast(fname, step)
+        if roast is None:
+            print(f"{fname}: no power log, skipping")
+            continue
+        roasts.append(roast)
+    if not roasts:
+        print("No usable roast logs")
+        sys.exit(1)
+
+    # a coarse pass over k for every number of
+    # cells, then a finer one around the best
+    ks = np.geomspace(5e-4, 0.03, 32)
+    i, j, r, base, sse, stats = FitModel(roasts, cells, ks, step)
+    ks = np.linspace(ks[max(j - 1, 0)], ks[min(j + 1, len(ks) - 1)], 32)
+    cells = [cells[i]]
+    i, j, r, base, sse, stats = FitModel(roasts, cells, ks, step)
+
+    model = ThermalModel(r=float(r), k=float(ks[j]), num_cells=cells[i], base_temp=float(base), step=step)
+    rms = float(np.sqrt(sse / sum(len(temp) for temp, power, init in roasts)))
+    SaveModel(models_file, roaster, model, roasts=len(roasts), rms=round(rms, 3))
+    print(f"{roaster}: {model} rms={rms:.2f} from {len(roasts)} roasts in {time.time() - started:.1f}s")